@@ -7,7 +7,10 @@ import os
 from flask import Response, jsonify
 
 # Import Appwrite utilities
-from appwrite_utils import AppwriteDB
+from appwrite_utils import get_db, fan_out, enable_cache_snapshots
+from appwrite_async import get_async_db, run_async
+from business_summary import get_summaries, SUMMARY_COLLECTION
+from ledger_service import get_ledger
 from appwrite.query import Query
 
 # Import performance configuration
@@ -27,7 +30,8 @@ cloudinary.config(
 )
 
 # Initialize Appwrite DB
-appwrite_db = AppwriteDB()
+appwrite_db = get_db()
+enable_cache_snapshots()  # Warm restarts for the web process (opt-in via CACHE_SNAPSHOT_PATH)
 
 # Cloudinary helper functions
 def get_cloudinary_url(public_id, transformation=None):
@@ -431,56 +435,27 @@ def business_dashboard():
         user_id = safe_uuid(session.get('user_id'))
         business_id = safe_uuid(session.get('business_id'))
         
-        # Get business details using Appwrite
+        # Get business details, its summary document and recent activity - OPTIMIZED: one coroutine on the
+        # async client runs the independent queries together, then the recent customers' lookups, with no
+        # thread hand-offs in between
         appwrite_db._ensure_initialized()
         from appwrite.query import Query
-        
-        business = appwrite_db.get_document('businesses', business_id)
-        
-        if not business:
-            # Create mock business object from session data
-            business = {
-                '$id': business_id,
-                'name': session.get('business_name', 'Your Business'),
-                'description': 'Business account',
-                'access_pin': session.get('access_pin', '0000')
-            }
-        
-        # Get summary data using Appwrite
-        total_customers = 0
-        total_credit = 0
-        total_payments = 0
-        transactions = []
-        customers = []
-        
-        try:
-            # Get customer credits for this business - OPTIMIZED: single query
-            customer_credits = appwrite_db.list_documents('customer_credits', [
-                Query.equal('business_id', business_id),
-                Query.limit(100)  # Reasonable limit
-            ])
-            total_customers = len(customer_credits)
-            
-            # Get all transactions for this business (limited for dashboard) - OPTIMIZED: single query
-            all_transactions = appwrite_db.list_documents('transactions', [
-                Query.equal('business_id', business_id),
-                Query.order_desc('created_at'),
-                Query.limit(50)
-            ])
-            
-            # Calculate totals from transactions
-            for transaction in all_transactions:
-                amount = float(transaction.get('amount', 0))
-                if transaction.get('transaction_type') == 'credit':
-                    total_credit += amount
-                elif transaction.get('transaction_type') == 'payment':
-                    total_payments += amount
-            
-            # Get recent transactions for display (limited to 10)
-            transactions = all_transactions[:10]
+        async_db = get_async_db()
+        
+        async def load_dashboard():
+            business, business_summary, transactions = await async_db.gather(
+                async_db.get_document('businesses', business_id),
+                # OPTIMIZED: Totals are maintained on every write, one cached document read
+                async_db.get_document(SUMMARY_COLLECTION, business_id),
+                # Recent transactions for display
+                async_db.list_documents('transactions', [
+                    Query.equal('business_id', business_id),
+                    Query.order_desc('created_at'),
+                    Query.limit(MAX_TRANSACTIONS_DASHBOARD)
+                ], fields=['customer_id', 'amount', 'transaction_type', 'notes', 'created_at'])
+            )
             
             # OPTIMIZED: Build customer list from recent transactions for dashboard
-            customers_list = []
             recent_customer_ids = []
             
             # Get unique customer IDs from recent transactions (most recent first) - show exactly 5
@@ -488,45 +463,56 @@ def business_dashboard():
                 customer_id = transaction.get('customer_id')
                 if customer_id and customer_id not in recent_customer_ids:
                     recent_customer_ids.append(customer_id)
-                    if len(recent_customer_ids) >= 5:  # Limit to exactly 5 customers
+                    if len(recent_customer_ids) >= MAX_CUSTOMERS_DASHBOARD:  # Limit to exactly 5 customers
                         break
+            if not recent_customer_ids:
+                return business, business_summary, transactions, [], []
             
-            # Get customer details and balances for selected customers (only from recent transactions)
-            for customer_id in recent_customer_ids:
-                try:
-                    customer = appwrite_db.get_document('customers', customer_id)
-                    if customer:
-                        # Find the customer's current balance from customer_credits
-                        customer_balance = 0
-                        for credit in customer_credits:
-                            if credit.get('customer_id') == customer_id:
-                                customer_balance = credit.get('current_balance', 0)
-                                break
-                        
-                        customer_data = {
-                            'id': customer['$id'],
-                            'name': customer.get('name', 'Unknown'),
-                            'phone_number': customer.get('phone_number', ''),
-                            'current_balance': customer_balance
-                        }
-                        customers_list.append(customer_data)
-                except Exception as e:
-                    print(f"Error getting customer {customer_id}: {str(e)}")
-                    continue
-            customers = customers_list
-            
-            # Calculate total outstanding - sum all positive customer balances from credits (faster)
-            total_outstanding = sum([credit.get('current_balance', 0) for credit in customer_credits if credit.get('current_balance', 0) > 0])
-            
-            # Limit to top 5 for display
-            customers = customers[:5]
-            
-            print(f"DEBUG: Business Dashboard Calculations:")
-            print(f"Total Outstanding (sum of positive customer balances): {total_outstanding}")
-            
+            # Get customer details and balances for only those customers, in parallel
+            recent_customers, recent_credits = await async_db.gather(
+                async_db.get_documents('customers', recent_customer_ids, fields=['name', 'phone_number']),
+                async_db.list_documents('customer_credits', [
+                    Query.equal('business_id', business_id),
+                    Query.equal('customer_id', recent_customer_ids),
+                    Query.limit(len(recent_customer_ids))
+                ], fields=['customer_id', 'current_balance'])
+            )
+            return business, business_summary, transactions, recent_customers, recent_credits
+        
+        try:
+            business, business_summary, transactions, recent_customers, recent_credits = run_async(load_dashboard())
+            if business_summary is None:
+                # First visit: the summary is built from the business's credits
+                business_summary = get_summaries().get(business_id)
         except Exception as e:
             print(f"Database error in business dashboard: {str(e)}")
-            # Use fallback empty data
+            business, business_summary, transactions, recent_customers, recent_credits = None, None, [], [], []
+        
+        if not business:
+            # Create mock business object from session data
+            business = {
+                '$id': business_id,
+                'name': session.get('business_name', 'Your Business'),
+                'description': 'Business account',
+                'access_pin': session.get('access_pin', '0000')
+            }
+        
+        business_summary = business_summary or {}
+        total_customers = business_summary.get('customer_count', 0)
+        total_outstanding = float(business_summary.get('total_outstanding', 0) or 0)
+        customers = []
+        
+        balances_by_customer = {credit.get('customer_id'): credit.get('current_balance', 0) for credit in recent_credits}
+        for customer in recent_customers:
+            customers.append({
+                'id': customer['$id'],
+                'name': customer.get('name', 'Unknown'),
+                'phone_number': customer.get('phone_number', ''),
+                'current_balance': balances_by_customer.get(customer['$id'], 0)
+            })
+        
+        print(f"DEBUG: Business Dashboard Summary:")
+        print(f"Total Outstanding (from business summary): {total_outstanding}")
         
         # Generate QR code
         try:
@@ -556,40 +542,18 @@ def business_customers():
     business_id = safe_uuid(session.get('business_id'))
     
     try:
-        # OPTIMIZED: Get all customer credits for this business
+        # OPTIMIZED: Customer credits carry maintained balances and counts, so no transactions are read
         customer_credits = appwrite_db.list_documents('customer_credits', [
             Query.equal('business_id', business_id),
             Query.limit(MAX_CUSTOMERS_PAGE)  # Performance optimized limit
-        ])
-        
-        # OPTIMIZED: Get all transactions for this business in one query
-        all_business_transactions = appwrite_db.list_documents('transactions', [
-            Query.equal('business_id', business_id),
-            Query.limit(1000)  # Increased limit but still reasonable
-        ])
-        
-        # OPTIMIZED: Build transaction lookup by customer_id for fast access
-        transactions_by_customer = {}
-        for transaction in all_business_transactions:
-            customer_id = transaction.get('customer_id')
-            if customer_id:
-                if customer_id not in transactions_by_customer:
-                    transactions_by_customer[customer_id] = []
-                transactions_by_customer[customer_id].append(transaction)
+        ], fields=['customer_id', 'current_balance', 'transaction_count'])
         
         # OPTIMIZED: Get customer details in batch
         customer_ids = [credit.get('customer_id') for credit in customer_credits if credit.get('customer_id')]
-        customers_dict = {}
-        
-        # Batch fetch customers
-        for customer_id in customer_ids:
-            try:
-                customer = appwrite_db.get_document('customers', customer_id)
-                if customer:
-                    customers_dict[customer_id] = customer
-            except Exception as e:
-                print(f"Error getting customer {customer_id}: {str(e)}")
-                continue
+        customers_dict = {
+            customer['$id']: customer
+            for customer in appwrite_db.get_documents('customers', customer_ids, fields=['name', 'phone_number'])
+        }
         
         # OPTIMIZED: Build customer list with pre-fetched data
         customers = []
@@ -598,18 +562,12 @@ def business_customers():
             if customer_id and customer_id in customers_dict:
                 customer = customers_dict[customer_id]
                 
-                # Calculate balance from pre-fetched transactions
-                customer_transactions = transactions_by_customer.get(customer_id, [])
-                credit_total = sum([float(t.get('amount', 0)) for t in customer_transactions if t.get('transaction_type') == 'credit'])
-                payment_total = sum([float(t.get('amount', 0)) for t in customer_transactions if t.get('transaction_type') == 'payment'])
-                current_balance = credit_total - payment_total
-                
                 customer_data = {
                     'id': customer['$id'],
                     'name': customer.get('name', 'Unknown'),
                     'phone_number': customer.get('phone_number', ''),
-                    'current_balance': current_balance,
-                    'transaction_count': len(customer_transactions)
+                    'current_balance': float(credit.get('current_balance') or 0),
+                    'transaction_count': credit.get('transaction_count') or 0
                 }
                 customers.append(customer_data)
         
@@ -630,21 +588,38 @@ def business_customer_details(customer_id):
     business_id = safe_uuid(session.get('business_id'))
     customer_id = safe_uuid(customer_id)
     
+    after = request.args.get('after')
+    before = request.args.get('before')
+    
     try:
-        # Get credit relationship
-        credit_response = appwrite_db.list_documents('customer_credits', [
-            Query.equal('business_id', business_id),
-            Query.equal('customer_id', customer_id)
-        ])
+        # Get credit relationship, customer details and one page of history in parallel
+        credit_response, customer, history = fan_out(
+            lambda: appwrite_db.list_documents('customer_credits', [
+                Query.equal('business_id', business_id),
+                Query.equal('customer_id', customer_id),
+                Query.limit(1)
+            ]),
+            lambda: appwrite_db.get_document('customers', customer_id),
+            # OPTIMIZED: Keyset page of recent transactions plus the exact total
+            lambda: appwrite_db.list_page('transactions', [
+                Query.equal('business_id', business_id),
+                Query.equal('customer_id', customer_id)
+            ], page_size=MAX_TRANSACTIONS_PER_PAGE, order_by='created_at', descending=True,
+                after=after, before=before)
+        )
         credit = credit_response[0] if credit_response else {}
         
-        # Get customer details
-        customer = appwrite_db.get_document('customers', customer_id)
-        
         if not customer:
             flash('Customer not found', 'error')
             return redirect(url_for('business_customers'))
         
+        # The balance is maintained by the ledger on every write; trust it and only
+        # queue a background reconciliation when the transaction count disagrees
+        if credit.get('transaction_count') != history['total'] and (credit or history['total']):
+            print(f"DEBUG: Balance drift suspected for customer {customer_id}: "
+                  f"{credit.get('transaction_count')} counted, {history['total']} found")
+            get_ledger().enqueue_reconcile(business_id, customer_id)
+        
         # Merge customer details with credit information
         customer_data = {
             'id': customer['$id'],
@@ -653,16 +628,9 @@ def business_customer_details(customer_id):
             'current_balance': credit.get('current_balance', 0)
         }
         
-        # Get transaction history using Appwrite
-        transactions = appwrite_db.list_documents('transactions', [
-            Query.equal('business_id', business_id),
-            Query.equal('customer_id', customer_id),
-            Query.order_desc('created_at')
-        ])
-        
         # Format transactions for display
         transactions_list = []
-        for tx in transactions:
+        for tx in history['documents']:
             transactions_list.append({
                 'id': tx['$id'],
                 'amount': float(tx.get('amount', 0)),
@@ -673,26 +641,6 @@ def business_customer_details(customer_id):
                 'receipt_image_url': tx.get('receipt_image_url', '')
             })
         
-        print(f"DEBUG: Found {len(transactions_list)} transactions for customer {customer_id}")
-        
-        # Calculate totals
-        credit_total = sum([float(t.get('amount', 0)) for t in transactions_list if t.get('transaction_type') == 'credit'])
-        payment_total = sum([float(t.get('amount', 0)) for t in transactions_list if t.get('transaction_type') == 'payment'])
-        
-        # Calculate the actual balance that customer should give
-        calculated_balance = credit_total - payment_total
-        
-        # Update the stored balance in customer_credits table to match calculated balance
-        if credit:
-            try:
-                appwrite_db.update_document('customer_credits', credit['$id'], {
-                    'current_balance': calculated_balance,
-                    'updated_at': get_ist_isoformat()
-                })
-                customer_data['current_balance'] = calculated_balance
-            except Exception as e:
-                print(f"Error updating customer balance: {str(e)}")
-        
     except Exception as e:
         print(f"Error in customer details: {str(e)}")
         flash('Error loading customer details', 'error')
@@ -701,9 +649,10 @@ def business_customer_details(customer_id):
     return render_template('business/customer_details.html', 
                          customer=customer_data, 
                          transactions=transactions_list,
-                         credit_total=credit_total,
-                         payment_total=payment_total,
-                         calculated_balance=calculated_balance)
+                         calculated_balance=customer_data['current_balance'],
+                         total_count=history['total'],
+                         next_token=history['next'],
+                         prev_token=history['prev'])
 
 @business_app.route('/add_customer', methods=['GET', 'POST'])
 @login_required
@@ -782,15 +731,8 @@ def add_customer():
                 flash('Customer already exists in your business!', 'warning')
                 return redirect(url_for('business_customers'))
             else:
-                # Create new credit relationship
-                credit_data = {
-                    'business_id': business_id,
-                    'customer_id': customer_id,
-                    'current_balance': initial_balance,
-                    'created_at': get_ist_isoformat(),
-                    'updated_at': get_ist_isoformat()
-                }
-                appwrite_db.create_document('customer_credits', credit_data)
+                # Create new credit relationship (also counted in the business summary)
+                get_ledger().open_account(business_id, customer_id, initial_balance)
                 print(f"DEBUG: Created credit relationship for customer {customer_id} with business {business_id}")
             
             flash('Customer added successfully! Customer can now login with phone number and password: devi123', 'success')
@@ -846,68 +788,15 @@ def business_transactions(customer_id):
                     except Exception as upload_error:
                         print(f"Error uploading to Cloudinary: {str(upload_error)}")
             
-            # Create transaction
-            transaction_data = {
-                'business_id': str(business_id),
-                'customer_id': str(customer_id),
-                'amount': amount,
-                'transaction_type': transaction_type,
-                'notes': notes,
-                'created_at': get_ist_isoformat(),
-                'created_by': str(session.get('user_id'))
-            }
-            
-            # Add receipt image URL if available
-            if receipt_image_url:
-                transaction_data['receipt_image_url'] = receipt_image_url
-            
-            print(f"DEBUG: Creating transaction with data: {transaction_data}")
-            result = appwrite_db.create_document('transactions', transaction_data)
+            # Create the transaction and apply it to the balance in one round trip
+            result = get_ledger().record_transaction(
+                business_id, customer_id, amount, transaction_type,
+                notes=notes,
+                created_by=session.get('user_id'),
+                receipt_image_url=receipt_image_url
+            )
             
             if result:
-                # Update customer balance in customer_credits table
-                try:
-                    # Get current balance
-                    credit_records = appwrite_db.list_documents('customer_credits', [
-                        Query.equal('business_id', business_id),
-                        Query.equal('customer_id', customer_id),
-                        Query.limit(1)
-                    ])
-                    
-                    if credit_records:
-                        credit_record = credit_records[0]
-                        current_balance = float(credit_record.get('current_balance', 0))
-                        
-                        # Calculate new balance based on transaction type
-                        if transaction_type == 'credit':
-                            new_balance = current_balance + amount  # Customer owes more
-                        else:  # payment
-                            new_balance = current_balance - amount  # Customer owes less
-                        
-                        # Update the balance
-                        appwrite_db.update_document('customer_credits', credit_record['$id'], {
-                            'current_balance': new_balance,
-                            'updated_at': get_ist_isoformat()
-                        })
-                        
-                        print(f"Updated customer balance: {current_balance} -> {new_balance} (transaction: {transaction_type} {amount})")
-                    else:
-                        # Create customer credit record if it doesn't exist
-                        initial_balance = amount if transaction_type == 'credit' else -amount
-                        credit_data = {
-                            'business_id': business_id,
-                            'customer_id': customer_id,
-                            'current_balance': initial_balance,
-                            'created_at': get_ist_isoformat(),
-                            'updated_at': get_ist_isoformat()
-                        }
-                        appwrite_db.create_document('customer_credits', credit_data)
-                        print(f"Created new customer credit record with balance: {initial_balance}")
-                
-                except Exception as balance_error:
-                    print(f"Error updating customer balance: {str(balance_error)}")
-                    # Don't fail the whole transaction, just log the error
-                
                 flash('Transaction added successfully', 'success')
             else:
                 flash('Failed to add transaction. Please try again.', 'error')
@@ -1057,41 +946,34 @@ def all_transactions():
     """View all transactions for the business"""
     try:
         business_id = safe_uuid(session.get('business_id'))
-        page = int(request.args.get('page', 1))
+        page = max(int(request.args.get('page', 1)), 1)
         per_page = MAX_TRANSACTIONS_PER_PAGE  # Optimized smaller page size
-        offset = (page - 1) * per_page
+        after = request.args.get('after')
+        before = request.args.get('before')
         
         transactions = []
         total_count = 0
+        next_token = None
+        prev_token = None
         
         try:
-            # OPTIMIZED: Get transactions with pagination and sorting (avoid double query)
-            paginated_transactions = appwrite_db.list_documents('transactions', [
-                Query.equal('business_id', business_id),
-                Query.order_desc('created_at'),
-                Query.limit(per_page),
-                Query.offset(offset)
-            ])
-            
-            # For pagination info, we'll estimate based on page results
-            # This is more efficient than fetching all records just to count
-            total_count = len(paginated_transactions) + offset
-            if len(paginated_transactions) == per_page:
-                # Likely more pages, estimate higher count
-                total_count += per_page
+            # OPTIMIZED: Keyset pagination - deep pages cost the same as page 1
+            result = appwrite_db.list_page('transactions', [
+                Query.equal('business_id', business_id)
+            ], page_size=per_page, order_by='created_at', descending=True, after=after, before=before)
+            paginated_transactions = result['documents']
+            total_count = result['total']
+            next_token = result['next']
+            prev_token = result['prev']
+            if not after and not before:
+                page = 1
             
             # OPTIMIZED: Batch get customer names
-            customer_ids = list(set([tx.get('customer_id') for tx in paginated_transactions if tx.get('customer_id')]))
-            customers_dict = {}
-            
-            # Batch fetch customer details
-            for customer_id in customer_ids:
-                try:
-                    customer = appwrite_db.get_document('customers', customer_id)
-                    if customer:
-                        customers_dict[customer_id] = customer.get('name', 'Unknown')
-                except:
-                    customers_dict[customer_id] = 'Unknown'
+            customer_ids = [tx.get('customer_id') for tx in paginated_transactions if tx.get('customer_id')]
+            customers_dict = {
+                customer['$id']: customer.get('name', 'Unknown')
+                for customer in appwrite_db.get_documents('customers', customer_ids, fields=['name'])
+            }
             
             # OPTIMIZED: Format transactions using pre-fetched customer data
             for tx in paginated_transactions:
@@ -1113,9 +995,10 @@ def all_transactions():
             flash('Error loading transactions', 'error')
         
         # Calculate pagination info
-        total_pages = (total_count + per_page - 1) // per_page
-        has_prev = page > 1
-        has_next = page < total_pages
+        total_pages = max((total_count + per_page - 1) // per_page, 1)
+        page = min(page, total_pages)
+        has_prev = prev_token is not None
+        has_next = next_token is not None
         
         return render_template('business/transactions.html',
                              transactions=transactions,
@@ -1123,6 +1006,8 @@ def all_transactions():
                              total_pages=total_pages,
                              has_prev=has_prev,
                              has_next=has_next,
+                             next_token=next_token,
+                             prev_token=prev_token,
                              total_count=total_count)
                              
     except Exception as e:
@@ -1193,33 +1078,11 @@ def sync_customer_data(customer_id):
     customer_id = safe_uuid(customer_id)
     
     try:
-        # Force refresh all transaction data for this customer using Appwrite
-        transactions = appwrite_db.list_documents('transactions', [
-            Query.equal('business_id', business_id),
-            Query.equal('customer_id', customer_id),
-            Query.order_desc('created_at')
-        ])
-        
-        # Recalculate balance
-        credit_total = sum([float(t.get('amount', 0)) for t in transactions if t.get('transaction_type') == 'credit'])
-        payment_total = sum([float(t.get('amount', 0)) for t in transactions if t.get('transaction_type') == 'payment'])
-        new_balance = credit_total - payment_total
-        
-        # Update the stored balance
-        credit_records = appwrite_db.list_documents('customer_credits', [
-            Query.equal('business_id', business_id),
-            Query.equal('customer_id', customer_id),
-            Query.limit(1)
-        ])
-        
-        if credit_records:
-            appwrite_db.update_document('customer_credits', credit_records[0]['$id'], {
-                'current_balance': new_balance,
-                'updated_at': get_ist_isoformat()
-            })
+        # Recompute balance and transaction count from the transactions, writing only on drift
+        result = get_ledger().reconcile(business_id, customer_id)
         
-        flash(f'Customer data synced successfully! Found {len(transactions)} transactions. Balance: ₹{new_balance:.2f}', 'success')
-        print(f"DEBUG: Synced customer {customer_id} - {len(transactions)} transactions, balance: {new_balance}")
+        flash(f"Customer data synced successfully! Found {result['transaction_count']} transactions. Balance: ₹{result['balance']:.2f}", 'success')
+        print(f"DEBUG: Synced customer {customer_id} - {result['transaction_count']} transactions, balance: {result['balance']}, changed: {result['changed']}")
         
     except Exception as e:
         print(f"Error syncing customer data: {str(e)}")
@@ -1323,37 +1186,39 @@ def remind_all_customers():
         # Get all customers with balances
         customers_to_remind = []
         
-        # Get all customer credits for this business
-        customer_credits = appwrite_db.list_documents('customer_credits', [
-            Query.equal('business_id', business_id)
-        ])
+        # Only customers who owe something; balances and counts are maintained on their credits
+        customer_credits = list(appwrite_db.iter_documents('customer_credits', [
+            Query.equal('business_id', business_id),
+            Query.greater_than('current_balance', 0)
+        ], fields=['customer_id', 'current_balance', 'transaction_count']))
+        
+        # Batch fetch customer details for every credit relationship
+        customers_by_id = {
+            customer['$id']: customer
+            for customer in appwrite_db.get_documents(
+                'customers', [credit.get('customer_id') for credit in customer_credits], fields=['name', 'phone_number']
+            )
+        }
         
         for credit in customer_credits:
+            customer = {}
             try:
                 customer_id = credit.get('customer_id')
-                if not customer_id:
+                if not customer_id or customer_id not in customers_by_id:
                     continue
                 
                 # Get customer details
-                customer = appwrite_db.get_document('customers', customer_id)
+                customer = customers_by_id[customer_id]
                 customer_name = customer.get('name', 'Customer')
                 phone_number = customer.get('phone_number', '')
                 
                 if not phone_number:
                     continue  # Skip customers without phone numbers
                 
-                # Calculate balance from transactions
-                transactions = appwrite_db.list_documents('transactions', [
-                    Query.equal('business_id', business_id),
-                    Query.equal('customer_id', customer_id)
-                ])
-                
-                if not transactions:
-                    continue  # Skip customers with no transactions
+                if credit.get('transaction_count') == 0:
+                    continue  # Skip customers with no transactions (a missing count is not backfilled yet)
                 
-                credit_total = sum([float(t.get('amount', 0)) for t in transactions if t.get('transaction_type') == 'credit'])
-                payment_total = sum([float(t.get('amount', 0)) for t in transactions if t.get('transaction_type') == 'payment'])
-                balance = credit_total - payment_total
+                balance = float(credit.get('current_balance') or 0)
                 
                 # Only include customers with positive balances
                 if balance <= 0:
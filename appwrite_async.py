@@ -0,0 +1,388 @@
+"""
+Asyncio-native Appwrite data access.
+
+AsyncAppwriteDB mirrors AppwriteDB (create/get/list/page/iterate/update/
+delete/query plus batch fetch and bulk update) but talks to the Appwrite REST
+API through a pooled httpx AsyncClient, so one worker can keep many Appwrite
+requests in flight. It shares the cache, request identity map, retry policy and
+invalidation rules of the AppwriteDB it wraps, through that class's public
+hooks (cached_document, document_read, cached_query, query_read,
+document_written, call_async, ...).
+
+Flask views stay synchronous and use the bridge (see business_dashboard):
+
+    async_db = get_async_db()
+    business, credits = run_async(async_db.gather(
+        async_db.get_document('businesses', business_id),
+        async_db.list_documents('customer_credits', [Query.equal('business_id', business_id)])
+    ))
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+
+from appwrite_utils import (
+    get_db, BATCH_FETCH_CHUNK_SIZE, PAGING_METHODS, filters_to_queries,
+    PagePlan, _query_method, _select_query, _with_projection
+)
+from performance_config import (CONNECTION_TIMEOUT, REQUEST_TIMEOUT, FANOUT_TIMEOUT, ASYNC_HTTP_MAX_CONNECTIONS,
+                                STREAM_PAGE_SIZE)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Background event loop that owns every AsyncClient, so its connection pool
+# outlives individual requests
+_bridge_loop = None
+_bridge_pid = None
+_bridge_lock = threading.Lock()
+
+
+def _get_bridge_loop():
+    """Event loop running on a daemon thread (recreated after a fork)"""
+    global _bridge_loop, _bridge_pid
+    pid = os.getpid()
+    if _bridge_loop is None or _bridge_pid != pid:
+        with _bridge_lock:
+            if _bridge_loop is None or _bridge_pid != pid:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='appwrite-async', daemon=True)
+                thread.start()
+                _bridge_loop = loop
+                _bridge_pid = pid
+    return _bridge_loop
+
+
+def run_async(coro, timeout=FANOUT_TIMEOUT):
+    """
+    Run a coroutine on the shared background loop and block until it finishes.
+
+    The coroutine sees a copy of the caller's context (including flask.g).
+    Raises TimeoutError (and cancels the coroutine) once timeout passes.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, _get_bridge_loop())
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"run_async deadline of {timeout}s exceeded")
+
+
+class AsyncAppwriteDB:
+    def __init__(self, sync_db=None):
+        # Cache, cache keys and write-through rules come from the wrapped AppwriteDB
+        self._db = sync_db or get_db()
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        """AsyncClient bound to the running loop"""
+        if httpx is None:
+            raise RuntimeError("AsyncAppwriteDB requires httpx (pip install httpx)")
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=os.environ.get('APPWRITE_ENDPOINT', 'https://cloud.appwrite.io/v1').rstrip('/'),
+                headers={
+                    'X-Appwrite-Project': os.environ.get('APPWRITE_PROJECT_ID', 'your_project_id'),
+                    'X-Appwrite-Key': os.environ.get('APPWRITE_API_KEY', 'your_api_key'),
+                    'X-Appwrite-Response-Format': '1.7.0',
+                    'Content-Type': 'application/json'
+                },
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECTION_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=ASYNC_HTTP_MAX_CONNECTIONS
+                )
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+
+    def _documents_path(self, collection_name, document_id=None):
+        database_id, collection_id = self._db.collection_location(collection_name)
+        path = f"/databases/{database_id}/collections/{collection_id}/documents"
+        return f"{path}/{document_id}" if document_id else path
+
+    async def _request(self, method, path, queries=None, body=None):
+        """Call the REST API, raising AppwriteException like the SDK does"""
+        client = self._get_client()
+        params = [(f'queries[{i}]', query) for i, query in enumerate(queries or [])]
+        try:
+            response = await client.request(method, path, params=params, json=body)
+        except httpx.HTTPError as e:
+            raise AppwriteException(str(e))
+        if response.status_code >= 400:
+            try:
+                payload = response.json()
+                raise AppwriteException(payload.get('message'), response.status_code, payload.get('type'), response.text)
+            except ValueError:
+                raise AppwriteException(response.text, response.status_code, None, response.text)
+        if response.status_code == 204 or not response.content:
+            return {}
+        return response.json()
+
+    async def _call(self, collection_name, fn, attempts=None, flight=None):
+        """Await fn() under the wrapped AppwriteDB's retry / circuit-breaker policy"""
+        return await self._db.call_async(collection_name, fn, attempts, flight)
+
+    @staticmethod
+    async def gather(*coros):
+        """Await several calls concurrently, returning results in order"""
+        return list(await asyncio.gather(*coros))
+
+    async def create_document(self, collection_name, data, document_id=None):
+        """Create a new document in collection"""
+        try:
+            if document_id is None:
+                document_id = str(uuid.uuid4())
+            from common_utils import get_ist_isoformat
+            now = get_ist_isoformat()
+            data['created_at'] = now
+            data['updated_at'] = now
+            attempts = []
+
+            async def create():
+                attempts.append(document_id)
+                try:
+                    return await self._request('POST', self._documents_path(collection_name),
+                                               body={'documentId': document_id, 'data': data})
+                except AppwriteException as e:
+                    # A retried create whose first attempt landed: return the stored document
+                    if e.code == 409 and len(attempts) > 1:
+                        return await self._request('GET', self._documents_path(collection_name, document_id))
+                    raise
+
+            result = await self._call(collection_name, create)
+            self._db.document_written(collection_name, document_id, result)
+            return result
+        except AppwriteException as e:
+            logger.error(f"Appwrite async create error: {e}")
+            return None
+
+    async def get_document(self, collection_name, document_id, fields=None):
+        """Get a single document by ID with caching (optionally only some fields)"""
+        generation = None
+        try:
+            cached_result = self._db.cached_document(collection_name, document_id, fields)
+            if cached_result is not None:
+                return cached_result
+            if self._db.known_missing(collection_name, document_id):
+                return None
+
+            generation = self._db.read_generation(collection_name)
+            result = await self._call(collection_name, lambda: self._request(
+                'GET', self._documents_path(collection_name, document_id),
+                queries=[_select_query(fields)] if fields else None),
+                flight=(collection_name, document_id, tuple(fields or ()), generation))
+            if result:
+                self._db.document_read(collection_name, document_id, result, generation, fields)
+            return result
+        except AppwriteException as e:
+            if e.code == 404 and generation is not None:
+                self._db.document_read(collection_name, document_id, None, generation)
+            logger.error(f"Appwrite async get error: {e}")
+            return None
+
+    async def get_documents(self, collection_name, document_ids, fields=None):
+        """Batch fetch by ID; uncached chunks are requested concurrently"""
+        ordered_ids = [doc_id for doc_id in dict.fromkeys(document_ids or []) if doc_id]
+        found = {}
+        missing = []
+        for doc_id in ordered_ids:
+            cached_result = self._db.cached_document(collection_name, doc_id, fields)
+            if cached_result is not None:
+                found[doc_id] = cached_result
+            elif not self._db.known_missing(collection_name, doc_id):
+                missing.append(doc_id)
+
+        async def fetch_chunk(chunk):
+            generation = self._db.read_generation(collection_name)
+            queries = [Query.equal('$id', chunk), Query.limit(len(chunk))]
+            if fields:
+                queries.append(_select_query(fields))
+            result = await self._call(collection_name, lambda: self._request(
+                'GET', self._documents_path(collection_name), queries=queries))
+            return chunk, generation, result['documents']
+
+        chunks = [missing[i:i + BATCH_FETCH_CHUNK_SIZE] for i in range(0, len(missing), BATCH_FETCH_CHUNK_SIZE)]
+        for outcome in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.error(f"Appwrite async batch get error: {outcome}")
+                continue
+            chunk, generation, documents = outcome
+            for document in documents:
+                found[document['$id']] = document
+                self._db.document_read(collection_name, document['$id'], document, generation, fields)
+            for doc_id in chunk:
+                if doc_id not in found:
+                    self._db.document_read(collection_name, doc_id, None, generation)
+        return [found[doc_id] for doc_id in ordered_ids if doc_id in found]
+
+    async def _run_list_query(self, collection_name, queries, use_cache=True):
+        """Async counterpart of AppwriteDB._run_list_query (same cache entries)"""
+        generation = self._db.read_generation(collection_name)
+        cached_result, cache_key = self._db.cached_query(collection_name, queries, use_cache)
+        if cached_result is not None:
+            return {'documents': list(cached_result['documents']), 'total': cached_result['total']}
+
+        result = await self._call(collection_name, lambda: self._request(
+            'GET', self._documents_path(collection_name), queries=queries), flight=cache_key)
+        page = {'documents': result['documents'], 'total': result.get('total', len(result['documents']))}
+        self._db.query_read(collection_name, queries, cache_key, page, generation)
+        return {'documents': list(page['documents']), 'total': page['total']}
+
+    async def list_documents(self, collection_name, queries=None, limit=100, use_cache=True, fields=None):
+        """List documents with optional queries (optionally only some fields)"""
+        try:
+            queries = _with_projection(list(queries) if queries else [], fields)
+            if not any(_query_method(q) == 'limit' for q in queries):
+                queries.append(Query.limit(limit))
+            return (await self._run_list_query(collection_name, queries, use_cache))['documents']
+        except AppwriteException as e:
+            logger.error(f"Appwrite async list error: {e}")
+            return []
+
+    async def list_page(self, collection_name, queries=None, page_size=25, order_by='created_at',
+                        descending=True, after=None, before=None, use_cache=True, fields=None):
+        """One keyset page plus the exact match count (see AppwriteDB.list_page)"""
+        try:
+            plan = PagePlan(queries, page_size, order_by, descending, after, before, fields)
+            try:
+                result = await self._run_list_query(collection_name, plan.queries, use_cache)
+            except AppwriteException:
+                if not plan.cursor:
+                    raise
+                # The cursor document was deleted; resume from its sort value instead
+                result, count = await self.gather(
+                    self._run_list_query(collection_name, plan.value_queries(), use_cache),
+                    self._run_list_query(collection_name, plan.count_queries(), use_cache)
+                )
+                return plan.page(result['documents'], count['total'], nearest_first=True)
+            return plan.page(result['documents'], result['total'])
+        except AppwriteException as e:
+            logger.error(f"Appwrite async page error: {e}")
+            return {'documents': [], 'total': 0, 'next': None, 'prev': None}
+
+    async def iter_documents(self, collection_name, queries=None, page_size=STREAM_PAGE_SIZE, fields=None):
+        """
+        Lazily yield every document matching queries, page by page (see
+        AppwriteDB.iter_documents); use with async for. Appwrite errors are
+        logged and re-raised so a partial walk is never mistaken for a complete one.
+        """
+        base_queries = _with_projection(
+            [q for q in (queries or []) if _query_method(q) not in PAGING_METHODS], fields
+        )
+        cursor = None
+        while True:
+            page_queries = base_queries + [Query.limit(page_size)]
+            if cursor:
+                page_queries.append(Query.cursor_after(cursor))
+            try:
+                result = await self._call(collection_name, lambda: self._request(
+                    'GET', self._documents_path(collection_name), queries=page_queries))
+            except AppwriteException as e:
+                logger.error(f"Appwrite async iterate error: {e}")
+                raise
+            documents = result['documents']
+            for document in documents:
+                yield document
+            if len(documents) < page_size:
+                return
+            cursor = documents[-1]['$id']
+
+    async def query_documents(self, collection_name, filters=None, limit=100, use_cache=True, fields=None):
+        """Query documents with filters"""
+        try:
+            queries = _with_projection(filters_to_queries(filters), fields)
+            queries.append(Query.limit(limit))
+            return (await self._run_list_query(collection_name, queries, use_cache))['documents']
+        except AppwriteException as e:
+            logger.error(f"Appwrite async query error: {e}")
+            return []
+
+    async def update_document(self, collection_name, document_id, data):
+        """Update a document"""
+        try:
+            from common_utils import get_ist_isoformat
+            data['updated_at'] = get_ist_isoformat()
+            result = await self._call(collection_name, lambda: self._request(
+                'PATCH', self._documents_path(collection_name, document_id), body={'data': data}))
+            self._db.document_written(collection_name, document_id, result)
+            return result
+        except AppwriteException as e:
+            logger.error(f"Appwrite async update error: {e}")
+            self._db.document_written(collection_name, document_id, None)
+            return None
+
+    async def update_documents(self, collection_name, data, queries):
+        """Set the given attributes on every document matching queries (see AppwriteDB.update_documents)"""
+        try:
+            from common_utils import get_ist_isoformat
+            data['updated_at'] = get_ist_isoformat()
+            result = await self._call(collection_name, lambda: self._request(
+                'PATCH', self._documents_path(collection_name), body={'data': data, 'queries': list(queries)}))
+            documents = result.get('documents', [])
+            for document in documents:
+                self._db.document_written(collection_name, document['$id'], document)
+            return documents
+        except AppwriteException as e:
+            logger.error(f"Appwrite async bulk update error: {e}")
+            self._db.queries_written(collection_name, queries)
+            return []
+
+    async def increment_document(self, collection_name, document_id, attribute, value):
+        """Atomically add value to a numeric attribute (never retried; None = unknown outcome)"""
+        try:
+            path = f"{self._documents_path(collection_name, document_id)}/{attribute}/" + \
+                ('increment' if value >= 0 else 'decrement')
+            result = await self._call(collection_name, lambda: self._request(
+                'PATCH', path, body={'value': abs(value)}), attempts=1)
+            self._db.document_written(collection_name, document_id, result)
+            return result
+        except AppwriteException as e:
+            logger.error(f"Appwrite async increment error: {e}")
+            self._db.document_written(collection_name, document_id, None)
+            return None
+
+    async def delete_document(self, collection_name, document_id):
+        """Delete a document"""
+        try:
+            await self._call(collection_name, lambda: self._request(
+                'DELETE', self._documents_path(collection_name, document_id)))
+            self._db.document_written(collection_name, document_id, None)
+            return True
+        except AppwriteException as e:
+            logger.error(f"Appwrite async delete error: {e}")
+            self._db.document_written(collection_name, document_id, None)
+            return False
+
+
+# One AsyncAppwriteDB per process, wrapping the shared AppwriteDB
+_shared_async_db = None
+_shared_async_db_lock = threading.Lock()
+
+
+def get_async_db():
+    """The shared AsyncAppwriteDB instance (one pooled client per worker)"""
+    global _shared_async_db
+    if _shared_async_db is None:
+        with _shared_async_db_lock:
+            if _shared_async_db is None:
+                _shared_async_db = AsyncAppwriteDB()
+    return _shared_async_db
@@ -0,0 +1,581 @@
+"""
+Bounded in-memory cache used by AppwriteDB to avoid repeated Appwrite round trips
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Query methods whose relative order changes the result; everything else is a
+# filter (or paging option) and can be compared order-insensitively.
+ORDER_SENSITIVE_METHODS = ('orderAsc', 'orderDesc')
+
+# Snapshot file format; version 2 snapshots are only written at a clean shutdown
+SNAPSHOT_VERSION = 2
+
+
+def query_fingerprint(queries):
+    """
+    Canonical hash of a list of serialized Appwrite Query strings.
+
+    Filters are sorted so that equivalent queries built in a different order
+    share one cache entry; ordering clauses keep their relative position.
+    """
+    filters = []
+    ordering = []
+    for query in queries or []:
+        try:
+            parsed = json.loads(query)
+        except (TypeError, ValueError):
+            filters.append(str(query))
+            continue
+        canonical = json.dumps(parsed, sort_keys=True, separators=(',', ':'))
+        if parsed.get('method') in ORDER_SENSITIVE_METHODS:
+            ordering.append(canonical)
+        else:
+            filters.append(canonical)
+    payload = json.dumps([sorted(filters), ordering], separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+CachePolicy = namedtuple('CachePolicy', 'ttl stale_ttl negative_ttl max_entries cache_lists')
+
+
+def build_cache_policies(table):
+    """
+    {collection: CachePolicy} from a declarative table such as
+    performance_config.CACHE_POLICIES; missing settings come from its 'default'
+    entry, which is also returned under 'default'.
+    """
+    defaults = {'ttl': 60, 'stale_ttl': 0, 'negative_ttl': 30, 'max_entries': None, 'cache_lists': True}
+    defaults.update(table.get('default', {}))
+    policies = {}
+    for name, settings in table.items():
+        unknown = set(settings) - set(CachePolicy._fields)
+        if unknown:
+            raise ValueError(f"Unknown cache policy setting(s) for '{name}': {', '.join(sorted(unknown))}")
+        policies[name] = CachePolicy(**{**defaults, **settings})
+    policies.setdefault('default', CachePolicy(**defaults))
+    return policies
+
+
+def cache_partition(key):
+    """Collection a cache key belongs to (keys start with '<collection>:')"""
+    return key.split(':', 1)[0]
+
+
+def estimate_size(value):
+    """Rough byte size of a cached Appwrite payload (documents are plain JSON)"""
+    try:
+        return len(json.dumps(value, default=str, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class GenerationTable:
+    """
+    Fixed-size table of generation counters.
+
+    Namespaces hash onto slots with a stable hash (so every process maps a
+    namespace to the same slot); two namespaces sharing a slot only causes an
+    extra invalidation, never a stale read. Memory stays bounded however many
+    namespaces (e.g. one per written document) are used.
+    """
+
+    def __init__(self, slots=65536):
+        self.slots = slots
+        self._values = [0] * slots
+        self._lock = threading.Lock()
+
+    def slot(self, namespace):
+        return zlib.crc32(namespace.encode('utf-8')) % self.slots
+
+    def get(self, namespace):
+        return self._values[self.slot(namespace)]
+
+    def bump(self, namespace):
+        index = self.slot(namespace)
+        with self._lock:
+            self._values[index] += 1
+            return self._values[index]
+
+    def foreign(self, namespace):
+        """Bumps made by other processes (always 0 for a process-local table)"""
+        return 0
+
+    def snapshot(self):
+        """Non-zero counters as {slot: value}, for cache snapshots"""
+        return {index: value for index, value in enumerate(self._values) if value}
+
+    def restore(self, values):
+        """Load counters saved by snapshot() (keys in a snapshot embed them)"""
+        with self._lock:
+            for index, value in values.items():
+                index = int(index)
+                if 0 <= index < self.slots:
+                    self._values[index] = max(self._values[index], int(value))
+
+
+class _CacheShard:
+    """One lock-protected LRU segment of the cache"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (data, expires_at, stale_until, size)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.partition_limits = {}  # collection -> max entries in this shard
+        self.partition_counts = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def _remove(self, key):
+        _, _, _, size = self.entries.pop(key)
+        self.bytes -= size
+        partition = cache_partition(key)
+        self.partition_counts[partition] = self.partition_counts.get(partition, 1) - 1
+
+    def _add(self, key, entry):
+        self.entries[key] = entry
+        self.bytes += entry[3]
+        partition = cache_partition(key)
+        self.partition_counts[partition] = self.partition_counts.get(partition, 0) + 1
+        return partition
+
+    def _evict_overflow(self, partition=None):
+        limit = self.partition_limits.get(partition)
+        if limit is not None and self.partition_counts.get(partition, 0) > limit:
+            # Evict this collection's least recently used entries first
+            for key in [k for k in self.entries if cache_partition(k) == partition]:
+                if self.partition_counts[partition] <= limit:
+                    break
+                self._remove(key)
+                self.evictions += 1
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+
+class DocumentCache:
+    """
+    Size- and byte-bounded LRU cache with per-entry TTL.
+
+    An entry may also carry a stale window after its TTL: get() treats it as
+    expired, while get_stale() keeps returning it (flagged stale) so callers
+    can serve it and refresh in the background.
+
+    With a shared store (see appwrite_shared_cache.SharedCacheStore), entries
+    are also written there and local misses fall back to it, so other worker
+    processes on the host can reuse them. Keys embed generation numbers, so the
+    store must be paired with shared generations (SharedGenerations) for its
+    keys to mean the same thing in every process. Keys starting with any of
+    shared_exclude (e.g. "users:") stay in this process only.
+
+    Keys are spread over several independently locked shards so concurrent
+    gunicorn threads only contend when they touch the same shard.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=32 * 1024 * 1024, default_ttl=60, stripes=16, shared=None,
+                 generations=None, partition_limits=None, shared_exclude=()):
+        stripes = max(1, int(stripes))
+        self.shared = shared
+        self.shared_exclude = tuple(shared_exclude)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        per_shard_entries = max(1, max_entries // stripes)
+        per_shard_bytes = max(1, max_bytes // stripes)
+        self._shards = [_CacheShard(per_shard_entries, per_shard_bytes) for _ in range(stripes)]
+        # Optional per-collection entry caps, spread over the shards like max_entries
+        for partition, limit in (partition_limits or {}).items():
+            if limit is not None:
+                for shard in self._shards:
+                    shard.partition_limits[partition] = max(1, limit // stripes)
+        # Generation counters let a whole namespace (e.g. a collection's cached
+        # query results) be invalidated in O(1); stale keys simply age out.
+        self._generations = generations or GenerationTable()
+
+    def _shares(self, key):
+        """Whether key goes through the shared store"""
+        return self.shared is not None and not key.startswith(self.shared_exclude)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key):
+        """Return the cached value for key, or None when missing or expired"""
+        data, stale = self.get_stale(key, count_stale=False)
+        return None if stale else data
+
+    def get_stale(self, key, count_stale=True):
+        """
+        Return (value, is_stale): fresh entries come back with is_stale False,
+        entries inside their stale window with True, anything else (None, False).
+        """
+        if key is None:
+            return None, False
+        shard = self._shard(key)
+        now = time.monotonic()
+        local = None
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None:
+                data, expires_at, stale_until, _ = entry
+                if stale_until <= now:
+                    shard._remove(key)
+                    shard.expirations += 1
+                elif expires_at > now:
+                    shard.entries.move_to_end(key)
+                    shard.hits += 1
+                    return data, False
+                else:
+                    local = data
+
+        # Local copy missing or stale: another worker may hold a fresher one
+        if self._shares(key):
+            row = self.shared.get(key)
+            if row is not None:
+                data, expires_wall, stale_wall = row
+                wall_now = time.time()
+                if expires_wall > wall_now or local is None:
+                    self._install(shard, key, data, now + (expires_wall - wall_now), now + (stale_wall - wall_now))
+                    local = data
+                    if expires_wall > wall_now:
+                        with shard.lock:
+                            shard.hits += 1
+                        return data, False
+
+        with shard.lock:
+            if local is None or not count_stale:
+                shard.misses += 1
+            else:
+                shard.stale_hits += 1
+        return local, local is not None
+
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        """
+        Store value under key for ttl seconds (defaults to the cache TTL),
+        then keep it for stale_ttl more seconds as a stale fallback.
+        """
+        if key is None:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        stale_ttl = max(stale_ttl or 0, 0)
+        now = time.monotonic()
+        self._install(self._shard(key), key, value, now + ttl, now + ttl + stale_ttl)
+        if self._shares(key):
+            wall_now = time.time()
+            self.shared.set(key, value, wall_now + ttl, wall_now + ttl + stale_ttl)
+
+    def _install(self, shard, key, value, expires_at, stale_until):
+        """Put an entry into the local LRU"""
+        size = estimate_size(value)
+        if size > shard.max_bytes:
+            # A single oversized payload would flush the whole shard
+            return
+        with shard.lock:
+            if key in shard.entries:
+                shard._remove(key)
+            partition = shard._add(key, (value, expires_at, stale_until, size))
+            shard._evict_overflow(partition)
+
+    def delete(self, key):
+        """Drop a single key; returns True when something was removed"""
+        if key is None:
+            return False
+        if self.shared is not None:
+            self.shared.delete(key)
+        shard = self._shard(key)
+        with shard.lock:
+            if key in shard.entries:
+                shard._remove(key)
+                return True
+        return False
+
+    def generation(self, namespace):
+        """Current generation number for a namespace"""
+        return self._generations.get(namespace)
+
+    def bump_generation(self, namespace):
+        """Invalidate every key built from the namespace's previous generation"""
+        return self._generations.bump(namespace)
+
+    def foreign_generation(self, namespace):
+        """How many times other worker processes have bumped the namespace"""
+        return self._generations.foreign(namespace)
+
+    def export_entries(self, limit, skip_prefixes=()):
+        """
+        Up to limit live entries, most recently used first, as
+        (key, value, expires_at, stale_until) with wall-clock times.
+        """
+        per_shard = max(1, limit // len(self._shards))
+        now = time.monotonic()
+        wall_now = time.time()
+        exported = []
+        for shard in self._shards:
+            with shard.lock:
+                items = list(reversed(shard.entries.items()))
+            taken = 0
+            for key, (value, expires_at, stale_until, _) in items:
+                if taken >= per_shard:
+                    break
+                if stale_until <= now or key.startswith(skip_prefixes):
+                    continue
+                exported.append((key, value, wall_now + (expires_at - now), wall_now + (stale_until - now)))
+                taken += 1
+        return exported
+
+    def import_entries(self, entries):
+        """Install entries from export_entries() with their remaining TTLs; returns how many were live"""
+        now = time.monotonic()
+        wall_now = time.time()
+        loaded = 0
+        for key, value, expires_wall, stale_wall in entries:
+            if stale_wall <= wall_now:
+                continue
+            self._install(self._shard(key), key, value, now + (expires_wall - wall_now), now + (stale_wall - wall_now))
+            loaded += 1
+        return loaded
+
+    def save_snapshot(self, path, limit, skip_prefixes=()):
+        """Write hot entries (and the counters their keys embed) to path atomically, at shutdown"""
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time.time(),
+            'generations': self._generations.snapshot(),
+            'entries': self.export_entries(limit, skip_prefixes),
+        }
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(snapshot, handle, default=str, separators=(',', ':'))
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save cache snapshot to {path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return 0
+        return len(snapshot['entries'])
+
+    def load_snapshot(self, path):
+        """
+        Warm the cache from a snapshot file and delete it; returns how many
+        entries were loaded. Consuming it means a process that later dies
+        without a clean shutdown leaves no snapshot behind, rather than one
+        that predates its writes.
+        """
+        try:
+            with open(path) as handle:
+                snapshot = json.load(handle)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache snapshot {path}: {e}")
+            return 0
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return 0
+        self._generations.restore(snapshot.get('generations') or {})
+        return self.import_entries(snapshot.get('entries') or [])
+
+    def clear(self):
+        """Remove every entry (counters are kept)"""
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.bytes = 0
+                shard.partition_counts.clear()
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def stats(self):
+        """Aggregate hit/miss/eviction counters and current memory use"""
+        totals = {'entries': 0, 'bytes': 0, 'hits': 0, 'stale_hits': 0, 'misses': 0, 'evictions': 0,
+                  'expirations': 0}
+        for shard in self._shards:
+            with shard.lock:
+                totals['entries'] += len(shard.entries)
+                totals['bytes'] += shard.bytes
+                totals['hits'] += shard.hits
+                totals['stale_hits'] += shard.stale_hits
+                totals['misses'] += shard.misses
+                totals['evictions'] += shard.evictions
+                totals['expirations'] += shard.expirations
+        lookups = totals['hits'] + totals['stale_hits'] + totals['misses']
+        served = totals['hits'] + totals['stale_hits']
+        totals['hit_rate'] = round(served / lookups, 4) if lookups else 0.0
+        totals['max_entries'] = self.max_entries
+        totals['max_bytes'] = self.max_bytes
+        if self.shared is not None:
+            totals['shared'] = self.shared.stats()
+        return totals
+
+
+class _Flight:
+    """One in-flight call that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the
+    call, everyone arriving while it is in flight waits and shares its result
+    (or its exception). Nothing is remembered once the call returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return fn(), sharing one execution among concurrent callers of key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def do_async(self, key, fn):
+        """Async counterpart of do(); fn returns a fresh coroutine"""
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._async_flights.get(flight_key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the leader's call
+            return await asyncio.shield(future)
+        future = self._async_flights[flight_key] = loop.create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved so a flight without followers does not log it
+            future.exception()
+            raise
+        finally:
+            self._async_flights.pop(flight_key, None)
+
+
+class NegativeCache:
+    """
+    Short-lived record of lookups that found nothing.
+
+    Each entry stores the equality conditions it was looked up with
+    ({attribute: (values...)}, with '$id' for get-by-ID). A write whose document
+    satisfies an entry's conditions drops it, so a create makes the same
+    lookup hit Appwrite again straight away while unrelated misses stay cached.
+    An optional stamp per entry is re-checked with validate(stamp) on every
+    hit, which lets writes made by other processes retire entries too.
+    """
+
+    def __init__(self, ttl=30, max_entries=1024, validate=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # validate(stamp) -> False once an entry's generation stamp has moved on
+        self.validate = validate
+        self._lock = threading.Lock()
+        self._entries = {}  # collection -> OrderedDict(key -> (conditions, expires_at))
+        self.hits = 0
+
+    def add(self, collection_name, key, conditions, ttl=None, stamp=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(collection_name, OrderedDict())
+            entries.pop(key, None)
+            entries[key] = (conditions, time.monotonic() + ttl, stamp)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def contains(self, collection_name, key):
+        """True while key is a known miss"""
+        with self._lock:
+            entries = self._entries.get(collection_name)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                return False
+            if entry[1] <= time.monotonic():
+                del entries[key]
+                return False
+        # Checked outside the lock: validate reads generation counters
+        if entry[2] is not None and self.validate is not None and not self.validate(entry[2]):
+            self.discard(collection_name, key)
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def discard(self, collection_name, key):
+        with self._lock:
+            entries = self._entries.get(collection_name)
+            if entries:
+                entries.pop(key, None)
+
+    def invalidate(self, collection_name, document=None):
+        """Drop entries the written document could satisfy (all of them when it is unknown)"""
+        with self._lock:
+            entries = self._entries.get(collection_name)
+            if not entries:
+                return
+            if document is None:
+                entries.clear()
+                return
+            now = time.monotonic()
+            for key, (conditions, expires_at, _) in list(entries.items()):
+                if expires_at <= now or all(document.get(attribute) in values
+                                            for attribute, values in conditions.items()):
+                    del entries[key]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
@@ -3,32 +3,38 @@ import os
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
-from appwrite.client import Client
-from appwrite.services.databases import Databases
 
 # Load environment variables
 load_dotenv()
 
 class AppwriteConfig:
-    def __init__(self):
-        # Initialize Appwrite client
-        self.client = Client()
-        self.client.set_endpoint(os.environ.get('APPWRITE_ENDPOINT', 'https://cloud.appwrite.io/v1'))
-        self.client.set_project(os.environ.get('APPWRITE_PROJECT_ID', 'your_project_id'))
-        self.client.set_key(os.environ.get('APPWRITE_API_KEY', 'your_api_key'))
-
-        # Initialize Databases service
-        self.databases = Databases(self.client)
-        self.database_id = os.environ.get('APPWRITE_DATABASE_ID', 'kathape_business')
-        
-        # Collection mapping
-        self.collections = {
-            'users': 'users',
-            'businesses': 'businesses', 
-            'customers': 'customers',
-            'customer_credits': 'customer_credits',
-            'transactions': 'transactions'
-        }
+    """
+    Raw Appwrite handles (client, Databases service, IDs) for code that needs the
+    SDK directly, e.g. schema setup. They belong to the shared AppwriteDB, so
+    there is only one client per process; nothing is built until first access.
+    """
+
+    def _shared(self):
+        from appwrite_utils import get_db
+        shared_db = get_db()
+        shared_db._ensure_initialized()
+        return shared_db
+
+    @property
+    def client(self):
+        return self._shared().client
+
+    @property
+    def databases(self):
+        return self._shared().databases
+
+    @property
+    def database_id(self):
+        return self._shared().database_id
+
+    @property
+    def collections(self):
+        return self._shared().collections
 
     def get_databases(self):
         return self.databases
@@ -0,0 +1,197 @@
+"""
+Retry and circuit-breaker policy for Appwrite calls.
+
+Transient failures (timeouts, connection resets, 429 and 5xx responses) are
+retried with jittered exponential backoff, within a total time budget per call
+(RETRY_BUDGET) so retries never hold a request thread past its deadline.
+Repeated transient failures on a
+collection open its circuit breaker, after which calls fail fast with
+CircuitOpenError until a probe call succeeds again.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from appwrite.exception import AppwriteException
+
+from performance_config import (
+    DB_RETRY_ATTEMPTS, DB_RETRY_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET, REQUEST_TIMEOUT,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying; everything else (400, 401, 404, 409...) is final
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(AppwriteException):
+    """Raised instead of calling Appwrite while a collection's circuit is open"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit open for '{name}', retry in {retry_in:.1f}s", 503, 'circuit_open')
+
+
+def is_retryable(error):
+    """True for network-level failures and transient Appwrite server responses"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, AppwriteException):
+        # The SDK wraps connection errors and timeouts with no status code
+        return not error.code or error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive transient failures -> half-open probe after a cool-down"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        return self._state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go through"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self._state == self.OPEN and elapsed >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                # Let exactly one probe through
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(self.name, max(self.reset_timeout - elapsed, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit for '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """A half-open probe ended with a non-transient error; allow another probe"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """Runs calls with retries and a circuit breaker per key (one per collection)"""
+
+    def __init__(self, attempts=DB_RETRY_ATTEMPTS, base_delay=DB_RETRY_DELAY, max_delay=RETRY_MAX_DELAY,
+                 budget=RETRY_BUDGET, attempt_timeout=REQUEST_TIMEOUT):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.attempt_timeout = attempt_timeout
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(key))
+        return breaker
+
+    def backoff(self, attempt):
+        """Full-jitter exponential delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _retry_delay(self, started, attempt):
+        """
+        Backoff before retry number `attempt`, or None when the retry could not
+        finish (a full attempt_timeout) inside the call's budget
+        """
+        delay = self.backoff(attempt)
+        if time.monotonic() - started + delay + self.attempt_timeout > self.budget:
+            return None
+        return delay
+
+    def _handle_failure(self, breaker, error, attempt, attempts):
+        """Record a failed attempt; returns True when it should be retried"""
+        if not is_retryable(error):
+            if isinstance(error, AppwriteException):
+                # Appwrite answered (404, 409, ...), so it is healthy
+                breaker.record_success()
+            else:
+                breaker.release_probe()
+            return False
+        breaker.record_failure()
+        return attempt < attempts and breaker.state != CircuitBreaker.OPEN
+
+    def call(self, key, fn, attempts=None):
+        """Call fn() under the policy for key (attempts=1 for calls that are unsafe to repeat)"""
+        breaker = self.breaker(key)
+        attempts = attempts or self.attempts
+        started = time.monotonic()
+        for attempt in range(1, attempts + 1):
+            breaker.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                if not self._handle_failure(breaker, e, attempt, attempts):
+                    raise
+                delay = self._retry_delay(started, attempt)
+                if delay is None:
+                    logger.warning(f"Not retrying '{key}' after transient error ({e}): retry budget spent")
+                    raise
+                logger.warning(f"Retrying '{key}' after transient error ({e}); attempt {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    async def call_async(self, key, fn, attempts=None):
+        """Await fn() under the policy for key (fn returns a fresh coroutine each time)"""
+        breaker = self.breaker(key)
+        attempts = attempts or self.attempts
+        started = time.monotonic()
+        for attempt in range(1, attempts + 1):
+            breaker.before_call()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self._handle_failure(breaker, e, attempt, attempts):
+                    raise
+                delay = self._retry_delay(started, attempt)
+                if delay is None:
+                    logger.warning(f"Not retrying '{key}' after transient error ({e}): retry budget spent")
+                    raise
+                logger.warning(f"Retrying '{key}' after transient error ({e}); attempt {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self):
+        """Current breaker state per key"""
+        return {key: breaker.state for key, breaker in list(self._breakers.items())}
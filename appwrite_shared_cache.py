@@ -0,0 +1,232 @@
+"""
+Cache tier and invalidation channel shared by every worker process on the host.
+
+Gunicorn workers each keep their own in-memory DocumentCache; SharedCacheStore
+sits underneath them in a SQLite file opened in WAL mode, so a document one
+worker fetched (or wrote) is a local-disk read for the others instead of an
+Appwrite round trip. Entries carry wall-clock expiry times because monotonic
+clocks are not comparable across processes.
+
+SharedGenerations keeps the cache's generation counters in a memory-mapped
+file, so a write in one worker bumps the counters every worker builds its
+cache keys from, and their now-stale entries stop being found.
+
+Failures here are never fatal: any SQLite error is logged and treated as a miss.
+"""
+import json
+import logging
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import threading
+import time
+
+from appwrite_cache import GenerationTable
+
+try:
+    import fcntl
+except ImportError:  # Windows: run without cross-worker sharing
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Prune expired / overflowing rows once every this many writes
+PRUNE_EVERY_WRITES = 200
+
+
+class SharedCacheStore:
+    """Key -> JSON value store with TTL metadata in a SQLite WAL file"""
+
+    def __init__(self, path, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._restrict_files()
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, stale_until REAL NOT NULL)"
+        )
+        self._execute("CREATE INDEX IF NOT EXISTS cache_entries_stale_until ON cache_entries (stale_until)")
+
+    def _restrict_files(self):
+        """
+        Create the database and its -wal/-shm files owner-only (0600) before
+        SQLite opens them: cached documents include customer and business data.
+        SQLite gives the -wal/-shm files the database file's mode when it
+        creates them; existing ones are tightened here too.
+        """
+        for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+            try:
+                if path == self.path or os.path.exists(path):
+                    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+                    os.chmod(path, 0o600)
+            except OSError as e:
+                self.errors += 1
+                logger.warning(f"Shared cache error ({path}): {e}")
+
+    def _connection(self):
+        """One connection per thread, reopened after a fork"""
+        pid = os.getpid()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != pid:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = pid
+        return connection
+
+    def _execute(self, sql, params=()):
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared cache error ({self.path}): {e}")
+            return None
+
+    def get(self, key):
+        """(value, expires_at, stale_until) in wall-clock seconds, or None"""
+        rows = self._execute("SELECT value, expires_at, stale_until FROM cache_entries WHERE key = ?", (key,))
+        if not rows or rows[0][2] <= time.time():
+            self.misses += 1
+            return None
+        value, expires_at, stale_until = rows[0]
+        try:
+            value = json.loads(value)
+        except ValueError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value, expires_at, stale_until
+
+    def set(self, key, value, expires_at, stale_until):
+        try:
+            payload = json.dumps(value, default=str, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, stale_until) VALUES (?, ?, ?, ?)",
+            (key, payload, expires_at, stale_until)
+        )
+        self._writes += 1
+        if self._writes % PRUNE_EVERY_WRITES == 0:
+            self.prune()
+
+    def delete(self, key):
+        self._execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def prune(self):
+        """Drop expired rows, then the soonest-expiring rows beyond max_entries"""
+        self._execute("DELETE FROM cache_entries WHERE stale_until <= ?", (time.time(),))
+        self._execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            "SELECT key FROM cache_entries ORDER BY stale_until DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        rows = self._execute("SELECT COUNT(*) FROM cache_entries")
+        return {
+            'path': self.path,
+            'entries': rows[0][0] if rows else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def open_shared_store(path, max_entries=20000):
+    """SharedCacheStore for path, or None when path is unset or unusable"""
+    if not path:
+        return None
+    store = SharedCacheStore(path, max_entries)
+    if store.errors:
+        logger.warning(f"Shared cache disabled: could not open {path}")
+        return None
+    return store
+
+
+class SharedGenerations(GenerationTable):
+    """GenerationTable whose counters live in a memory-mapped file shared by all workers"""
+
+    _SLOT = struct.Struct('<Q')
+
+    def __init__(self, path, slots=65536):
+        super().__init__(slots)
+        size = slots * self._SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._file_lock():
+            if os.fstat(self._fd).st_size < size:
+                # Start a new file at a random base so its numbers never repeat
+                # ones an older file handed out (keys in the SQLite store embed them)
+                base = random.getrandbits(40)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self._SLOT.pack(base) * slots, 0)
+        self._map = mmap.mmap(self._fd, size)
+        # This process's own bumps per slot, to tell them apart from other workers'
+        self._values = [0] * slots
+
+    def _file_lock(self):
+        return _FileLock(self._fd, self._lock)
+
+    def get(self, namespace):
+        return self._SLOT.unpack_from(self._map, self.slot(namespace) * self._SLOT.size)[0]
+
+    def bump(self, namespace):
+        index = self.slot(namespace)
+        offset = index * self._SLOT.size
+        with self._file_lock():
+            value = self._SLOT.unpack_from(self._map, offset)[0] + 1
+            self._SLOT.pack_into(self._map, offset, value)
+            self._values[index] += 1
+        return value
+
+    def foreign(self, namespace):
+        return self.get(namespace) - self._values[self.slot(namespace)]
+
+    def snapshot(self):
+        # The counters file outlives the process on its own
+        return {}
+
+    def restore(self, values):
+        pass
+
+
+class _FileLock:
+    """Thread lock plus a POSIX record lock (lockf locks are per process, so they survive fork correctly)"""
+
+    def __init__(self, fd, thread_lock):
+        self.fd = fd
+        self.thread_lock = thread_lock
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except OSError:
+            self.thread_lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+def open_shared_generations(path, slots=65536):
+    """SharedGenerations for path, or None when path is unset or unusable"""
+    if not path:
+        return None
+    if fcntl is None:
+        logger.warning("Shared cache generations need fcntl (POSIX); running per-process")
+        return None
+    try:
+        return SharedGenerations(path, slots)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Shared cache generations disabled: could not open {path}: {e}")
+        return None
@@ -0,0 +1,128 @@
+"""
+Shared HTTP transport for every Appwrite client in the process.
+
+The stock Appwrite SDK calls requests.request() for each API call, which opens a
+fresh connection (TCP + TLS handshake) every time. PooledClient sends the same
+requests through one process-wide requests.Session whose connection pool keeps
+TLS connections to Appwrite alive and reuses them across calls and threads.
+"""
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from appwrite.client import Client
+from appwrite.exception import AppwriteException
+from appwrite.input_file import InputFile
+from appwrite.encoders.value_class_encoder import ValueClassEncoder
+
+from performance_config import CONNECTION_TIMEOUT, REQUEST_TIMEOUT, HTTP_POOL_SIZE
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Process-wide pooled session (rebuilt after a fork so workers never share sockets)"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, pool_block=False)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+class PooledClient(Client):
+    """Appwrite Client that sends requests over the shared keep-alive session"""
+
+    def __init__(self, timeout=None):
+        super().__init__()
+        self._timeout = timeout or (CONNECTION_TIMEOUT, REQUEST_TIMEOUT)
+
+    def call(self, method, path='', headers=None, params=None, response_type='json'):
+        # Mirrors appwrite.client.Client.call, swapping requests.request for the pooled session
+        if headers is None:
+            headers = {}
+
+        if params is None:
+            params = {}
+
+        params = {k: v for k, v in params.items() if v is not None}
+
+        data = {}
+        files = {}
+        stringify = False
+
+        headers = {**self._global_headers, **headers}
+
+        if method != 'get':
+            data = params
+            params = {}
+
+        if headers['content-type'].startswith('application/json'):
+            data = json.dumps(data, cls=ValueClassEncoder)
+
+        if headers['content-type'].startswith('multipart/form-data'):
+            del headers['content-type']
+            stringify = True
+            for key in data.copy():
+                if isinstance(data[key], InputFile):
+                    files[key] = (data[key].filename, data[key].data)
+                    del data[key]
+            data = self.flatten(data, stringify=stringify)
+
+        response = None
+        try:
+            response = get_http_session().request(
+                method=method,
+                url=self._endpoint + path,
+                params=self.flatten(params, stringify=stringify),
+                data=data,
+                files=files,
+                headers=headers,
+                verify=(not self._self_signed),
+                allow_redirects=False if response_type == 'location' else True,
+                timeout=self._timeout
+            )
+
+            response.raise_for_status()
+
+            warnings = response.headers.get('x-appwrite-warning')
+            if warnings:
+                for warning in warnings.split(';'):
+                    print(f'Warning: {warning}')
+
+            content_type = response.headers.get('Content-Type', '')
+
+            if response_type == 'location':
+                return response.headers.get('Location')
+
+            if content_type.startswith('application/json'):
+                return response.json()
+
+            return response.content
+        except Exception as e:
+            if response is not None:
+                content_type = response.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    body = response.json()
+                    raise AppwriteException(body.get('message'), response.status_code, body.get('type'), response.text)
+                raise AppwriteException(response.text, response.status_code, None, response.text)
+            raise AppwriteException(e)
+
+
+def create_client():
+    """Appwrite client configured from the environment and bound to the shared pool"""
+    client = PooledClient()
+    client.set_endpoint(os.environ.get('APPWRITE_ENDPOINT', 'https://cloud.appwrite.io/v1'))
+    client.set_project(os.environ.get('APPWRITE_PROJECT_ID', 'your_project_id'))
+    client.set_key(os.environ.get('APPWRITE_API_KEY', 'your_api_key'))
+    return client
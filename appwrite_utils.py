@@ -1,22 +1,219 @@
 """
 Appwrite Database Utilities - Replacement for PostgreSQL operations
 """
+import atexit
+import base64
+import contextvars
 import json
 import logging
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from datetime import datetime
 from dotenv import load_dotenv
-from appwrite.client import Client
+from flask import g, has_request_context
 from appwrite.services.databases import Databases
 from appwrite.query import Query
 from appwrite.exception import AppwriteException
+from appwrite_transport import create_client
+from appwrite_cache import DocumentCache, NegativeCache, SingleFlight, build_cache_policies, query_fingerprint
+from appwrite_resilience import RetryPolicy
+from appwrite_shared_cache import open_shared_generations, open_shared_store
+from performance_config import (
+    CACHE_POLICIES, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_LOCK_STRIPES, SWR_REFRESH_WORKERS,
+    SHARED_CACHE_PATH, SHARED_CACHE_MAX_ENTRIES,
+    CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_MAX_ENTRIES, CACHE_SNAPSHOT_EXCLUDE,
+    NEGATIVE_CACHE_MAX_ENTRIES, ENABLE_REQUEST_CACHING,
+    STREAM_PAGE_SIZE, FANOUT_MAX_WORKERS, FANOUT_TIMEOUT
+)
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Appwrite caps the number of values in a single equal() query at 100
+BATCH_FETCH_CHUNK_SIZE = 100
+
+# Query methods that control paging rather than which documents match
+PAGING_METHODS = ('limit', 'offset', 'cursorAfter', 'cursorBefore')
+
+def _query_method(query):
+    """Method name of a serialized Query string (e.g. 'equal', 'limit')"""
+    try:
+        return json.loads(query).get('method')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def filters_to_queries(filters):
+    """Translate a {field: value | {'$gt': value, ...}} filter dict into Query strings"""
+    queries = []
+    if filters:
+        for key, value in filters.items():
+            if isinstance(value, dict):
+                for op, val in value.items():
+                    if op == '$gt':
+                        queries.append(Query.greater_than(key, val))
+                    elif op == '$gte':
+                        queries.append(Query.greater_than_equal(key, val))
+                    elif op == '$lt':
+                        queries.append(Query.less_than(key, val))
+                    elif op == '$lte':
+                        queries.append(Query.less_than_equal(key, val))
+                    elif op == '$ne':
+                        queries.append(Query.not_equal(key, val))
+            else:
+                queries.append(Query.equal(key, value))
+    return queries
+
+def _normalize_fields(fields):
+    """Sorted, de-duplicated attribute list so equal projections share cache keys"""
+    return sorted(set(fields))
+
+def _select_query(fields):
+    """Query.select for a field projection"""
+    return Query.select(_normalize_fields(fields))
+
+# Query methods that do not change whether an equality lookup finds anything
+NEGATIVE_CACHEABLE_METHODS = ('equal', 'limit', 'select', 'orderAsc', 'orderDesc')
+
+def _equality_conditions(queries):
+    """
+    {attribute: (values...)} for a query made only of equal() filters (plus
+    limit/select/order), or None when an empty result could not be cached
+    as a plain miss.
+    """
+    conditions = {}
+    for query in queries:
+        try:
+            parsed = json.loads(query)
+        except (TypeError, ValueError):
+            return None
+        method = parsed.get('method')
+        if method not in NEGATIVE_CACHEABLE_METHODS:
+            return None
+        if method == 'equal':
+            attribute = parsed.get('attribute')
+            if attribute in conditions:
+                return None
+            conditions[attribute] = tuple(parsed.get('values') or ())
+    return conditions or None
+
+def _business_scope(queries):
+    """The business a query is restricted to (a single-value equal on business_id), else None"""
+    for query in queries or []:
+        try:
+            parsed = json.loads(query)
+        except (TypeError, ValueError):
+            continue
+        if parsed.get('method') == 'equal' and parsed.get('attribute') == 'business_id':
+            values = parsed.get('values') or []
+            if len(values) == 1:
+                return values[0]
+    return None
+
+def _document_namespace(collection_name, document_id):
+    """Generation namespace of a single document"""
+    return f"{collection_name}/{document_id}"
+
+def _request_identity_map():
+    """
+    Documents and query results already read during the current Flask request.
+
+    Stored on flask.g, so it lives exactly as long as the request and is shared
+    with fan_out / run_async workers (they run in a copy of the request context).
+    Returns None outside a request or when ENABLE_REQUEST_CACHING is off.
+    """
+    if not ENABLE_REQUEST_CACHING or not has_request_context():
+        return None
+    return g.setdefault('_appwrite_identity_map', {})
+
+def _with_projection(queries, fields):
+    """Replace any select in queries with the requested projection"""
+    if not fields:
+        return queries
+    return [q for q in queries if _query_method(q) != 'select'] + [_select_query(fields)]
+
+def encode_page_token(document, order_by='created_at'):
+    """Opaque keyset pagination token built from a document's sort value and $id"""
+    payload = json.dumps([document.get(order_by), document['$id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_token(token):
+    """Inverse of encode_page_token; returns (sort_value, document_id) or None"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, document_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (value, str(document_id))
+    except (TypeError, ValueError):
+        return None
+
+class PagePlan:
+    """
+    The queries behind one list_page() call and how their results become a
+    page; shared by AppwriteDB and AsyncAppwriteDB.
+    """
+
+    def __init__(self, queries, page_size, order_by, descending, after, before, fields):
+        if fields:
+            # Page tokens are built from the sort attribute
+            fields = list(fields) + [order_by]
+        self.page_size = page_size
+        self.order_by = order_by
+        self.descending = descending
+        self.base_queries = _with_projection(
+            [q for q in (queries or []) if _query_method(q) not in PAGING_METHODS], fields
+        )
+        self.cursor = decode_page_token(after or before)
+        self.backwards = self.cursor is not None and not after
+        order = Query.order_desc(order_by) if descending else Query.order_asc(order_by)
+        # Ask for one extra document to learn whether a further page exists
+        self.queries = self.base_queries + [order, Query.limit(page_size + 1)]
+        if self.cursor:
+            self.queries.append(Query.cursor_before(self.cursor[1]) if self.backwards
+                                else Query.cursor_after(self.cursor[1]))
+
+    def value_queries(self):
+        """
+        The page anchored on the cursor's sort value rather than its document
+        (for when that document was deleted), fetched nearest-first
+        """
+        # Walking towards larger values is "after" for ascending order and "before" for descending
+        towards_larger = self.descending == self.backwards
+        value = self.cursor[0]
+        bound = Query.greater_than(self.order_by, value) if towards_larger else Query.less_than(self.order_by, value)
+        order = Query.order_asc(self.order_by) if towards_larger else Query.order_desc(self.order_by)
+        return self.base_queries + [bound, order, Query.limit(self.page_size + 1)]
+
+    def count_queries(self):
+        """Cheapest query whose total is the exact match count"""
+        return self.base_queries + [Query.limit(1)]
+
+    def page(self, documents, total, nearest_first=False):
+        """{'documents', 'total', 'next', 'prev'} from the fetched documents"""
+        if nearest_first and self.backwards:
+            # Present in the page's natural order
+            documents = list(reversed(documents))
+        has_more = len(documents) > self.page_size
+        if self.backwards:
+            documents = documents[-self.page_size:]
+        else:
+            documents = documents[:self.page_size]
+        if not documents:
+            return {'documents': [], 'total': total, 'next': None, 'prev': None}
+
+        more_after = has_more if not self.backwards else True
+        more_before = has_more if self.backwards else self.cursor is not None
+        return {
+            'documents': documents,
+            'total': total,
+            'next': encode_page_token(documents[-1], self.order_by) if more_after else None,
+            'prev': encode_page_token(documents[0], self.order_by) if more_before else None
+        }
+
 class AppwriteDB:
     def __init__(self):
         self._initialized = False
@@ -24,21 +221,43 @@ class AppwriteDB:
         self.databases = None
         self.database_id = None
         self.collections = None
-        # Simple in-memory cache to reduce duplicate API calls
-        self._cache = {}
-        self._cache_ttl = 60  # Cache for 60 seconds
+        # Bounded LRU cache to reduce duplicate API calls. When SHARED_CACHE_PATH
+        # is set, generation counters and entries are shared by every worker on
+        # the host, so a write in one worker invalidates the others' copies.
+        # TTLs, stale windows, negative TTLs and caps come from the
+        # per-collection policy table in performance_config.CACHE_POLICIES.
+        self._cache_policies = build_cache_policies(CACHE_POLICIES)
+        self._cache_ttl = self._cache_policies['default'].ttl
+        generations = open_shared_generations(f"{SHARED_CACHE_PATH}.generations") if SHARED_CACHE_PATH else None
+        self._cache = DocumentCache(
+            max_entries=CACHE_MAX_ENTRIES,
+            max_bytes=CACHE_MAX_BYTES,
+            default_ttl=self._cache_ttl,
+            stripes=CACHE_LOCK_STRIPES,
+            shared=open_shared_store(SHARED_CACHE_PATH, SHARED_CACHE_MAX_ENTRIES) if generations else None,
+            generations=generations,
+            # Same collections the snapshot never writes to disk
+            shared_exclude=[f"{collection_name}:" for collection_name in CACHE_SNAPSHOT_EXCLUDE],
+            partition_limits={name: policy.max_entries for name, policy in self._cache_policies.items()
+                              if name != 'default'}
+        )
+        # Retries transient failures; one circuit breaker per collection
+        self._policy = RetryPolicy()
+        # Concurrent identical reads share one in-flight Appwrite call
+        self._flights = SingleFlight()
+        # Keys with a stale-while-revalidate refresh already queued
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        # Recent not-found lookups, dropped by a write that would match them
+        self._negatives = NegativeCache(ttl=self._cache_policies['default'].negative_ttl,
+                                        max_entries=NEGATIVE_CACHE_MAX_ENTRIES, validate=self._negative_stamp_valid)
         
     def _ensure_initialized(self):
         """Initialize Appwrite config when first used"""
         if not self._initialized:
-            # Initialize Appwrite client with optimization
-            self.client = Client()
-            self.client.set_endpoint(os.environ.get('APPWRITE_ENDPOINT', 'https://cloud.appwrite.io/v1'))
-            self.client.set_project(os.environ.get('APPWRITE_PROJECT_ID', 'your_project_id'))
-            self.client.set_key(os.environ.get('APPWRITE_API_KEY', 'your_api_key'))
-            # Add headers for better performance
+            # Initialize Appwrite client on the shared keep-alive connection pool
+            self.client = create_client()
             self.client.add_header('Cache-Control', 'no-cache')
-            self.client.add_header('Connection', 'keep-alive')
 
             # Initialize Databases service
             self.databases = Databases(self.client)
@@ -50,38 +269,359 @@ class AppwriteDB:
                 'businesses': 'businesses', 
                 'customers': 'customers',
                 'customer_credits': 'customer_credits',
-                'transactions': 'transactions'
+                'transactions': 'transactions',
+                'business_summaries': 'business_summaries'
             }
             self._initialized = True
     
-    def _get_cache_key(self, collection_name, document_id=None, query_hash=None):
-        """Generate cache key"""
+    def _get_cache_key(self, collection_name, document_id=None, query_hash=None, fields=None, business_id=None):
+        """
+        Generate cache key.
+
+        Every key embeds generation numbers, so bumping a generation (on this
+        or, with shared generations, any worker) makes older entries unreachable:
+        documents follow their own generation, query results follow their
+        business's generation when the query is scoped to one business and the
+        collection's generation otherwise.
+        """
         if document_id:
-            return f"{collection_name}:{document_id}"
+            generation = self._cache.generation(_document_namespace(collection_name, document_id))
+            if fields:
+                return f"{collection_name}:{document_id}:{generation}:select:{','.join(_normalize_fields(fields))}"
+            return f"{collection_name}:{document_id}:{generation}"
         elif query_hash:
-            return f"{collection_name}:query:{query_hash}"
+            if business_id:
+                generation = (f"{self._cache.generation(f'{collection_name}!all')}."
+                              f"{self._cache.generation(f'{collection_name}@{business_id}')}")
+            else:
+                generation = self._cache.generation(collection_name)
+            return f"{collection_name}:query:{generation}:{query_hash}"
         return None
+
+    def _query_cache_key(self, collection_name, queries, fingerprint=None):
+        """Cache key of a list query"""
+        return self._get_cache_key(collection_name, query_hash=fingerprint or query_fingerprint(queries),
+                                   business_id=_business_scope(queries))
+
+    def _cache_policy(self, collection_name):
+        """CachePolicy of a collection (the default policy when it has none)"""
+        return self._cache_policies.get(collection_name) or self._cache_policies['default']
+
+    def _cache_ttl_for(self, collection_name):
+        """Cache TTL for documents of a collection"""
+        return self._cache_policy(collection_name).ttl
     
-    def _is_cache_valid(self, cache_key):
-        """Check if cache entry is still valid"""
-        if cache_key not in self._cache:
-            return False
-        import time
-        return (time.time() - self._cache[cache_key]['timestamp']) < self._cache_ttl
-    
+    def _stale_ttl_for(self, collection_name):
+        """Seconds a collection's entries may be served stale while refreshing"""
+        return self._cache_policy(collection_name).stale_ttl
+
     def _get_from_cache(self, cache_key):
         """Get data from cache"""
-        if self._is_cache_valid(cache_key):
-            return self._cache[cache_key]['data']
-        return None
+        return self._cache.get(cache_key)
     
-    def _set_cache(self, cache_key, data):
+    def _set_cache(self, cache_key, data, ttl=None, stale_ttl=0):
         """Set data in cache"""
-        import time
-        self._cache[cache_key] = {
-            'data': data,
-            'timestamp': time.time()
-        }
+        self._cache.set(cache_key, data, ttl, stale_ttl)
+
+    def _store(self, collection_name, cache_key, data):
+        """Cache data with the collection's TTL and stale window"""
+        self._cache.set(cache_key, data, self._cache_ttl_for(collection_name), self._stale_ttl_for(collection_name))
+
+    def _get_or_revalidate(self, cache_key, refresh):
+        """
+        Cached value for cache_key; a stale one is returned as-is and
+        refresh() is queued on a background thread (once per key).
+        """
+        data, stale = self._cache.get_stale(cache_key)
+        if stale:
+            with self._refreshing_lock:
+                if cache_key in self._refreshing:
+                    return data
+                self._refreshing.add(cache_key)
+            try:
+                _refresh_executor.submit(self._run_refresh, cache_key, refresh)
+            except RuntimeError:
+                # Interpreter shutting down
+                with self._refreshing_lock:
+                    self._refreshing.discard(cache_key)
+        return data
+
+    def _run_refresh(self, cache_key, refresh):
+        try:
+            refresh()
+        except Exception as e:
+            logger.warning(f"Background cache refresh failed for {cache_key}: {e}")
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(cache_key)
+
+    def _refresh_document(self, collection_name, document_id, fields=None):
+        """Re-read a document into the cache (stale-while-revalidate)"""
+        self._ensure_initialized()
+        cache_key = self._get_cache_key(collection_name, document_id, fields=fields)
+        generation = self._cache.generation(collection_name)
+        try:
+            result = self._call(collection_name, lambda: self.databases.get_document(
+                database_id=self.database_id,
+                collection_id=self.collections[collection_name],
+                document_id=document_id,
+                queries=[_select_query(fields)] if fields else None
+            ))
+        except AppwriteException as e:
+            if e.code == 404:
+                self._cache.delete(cache_key)
+                return
+            raise
+        if generation == self._cache.generation(collection_name):
+            self._store(collection_name, cache_key, result)
+
+    def _refresh_query(self, collection_name, cache_key, queries):
+        """Re-run a list query into the cache (stale-while-revalidate)"""
+        self._ensure_initialized()
+        generation = self._cache.generation(collection_name)
+        result = self._call(collection_name, lambda: self.databases.list_documents(
+            database_id=self.database_id,
+            collection_id=self.collections[collection_name],
+            queries=queries
+        ))
+        # The key embeds the generation it was built for; skip if a write moved on
+        if generation == self._cache.generation(collection_name):
+            page = {'documents': result['documents'], 'total': result.get('total', len(result['documents']))}
+            self._store(collection_name, cache_key, page)
+
+    def _recall(self, collection_name, document_id, fields=None):
+        """Copy of a document this request has already seen (full copies satisfy projections)"""
+        identity_map = _request_identity_map()
+        if identity_map is None:
+            return None
+        copies = identity_map.get((collection_name, document_id))
+        if not copies:
+            return None
+        document = copies.get(None)
+        if document is None and fields:
+            document = copies.get(tuple(_normalize_fields(fields)))
+        return document
+
+    def _remember(self, collection_name, document_id, document, fields=None):
+        """Pin a document read for the rest of the request"""
+        identity_map = _request_identity_map()
+        if identity_map is not None and document is not None:
+            key = tuple(_normalize_fields(fields)) if fields else None
+            identity_map.setdefault((collection_name, document_id), {})[key] = document
+
+    def _get_document_from_cache(self, collection_name, document_id, fields=None):
+        """
+        Copy of a document from the request identity map, else the shared cache.
+        A cached full document also satisfies projections.
+        """
+        seen = self._recall(collection_name, document_id, fields)
+        if seen is not None:
+            return seen
+        cached_result = self._get_or_revalidate(
+            self._get_cache_key(collection_name, document_id),
+            lambda: self._refresh_document(collection_name, document_id)
+        )
+        if cached_result is not None:
+            self._remember(collection_name, document_id, cached_result)
+        elif fields:
+            cached_result = self._get_or_revalidate(
+                self._get_cache_key(collection_name, document_id, fields=fields),
+                lambda: self._refresh_document(collection_name, document_id, fields)
+            )
+            self._remember(collection_name, document_id, cached_result, fields)
+        return cached_result
+
+    def _get_query_from_cache(self, collection_name, cache_key, queries):
+        """Query page from the request identity map, else the shared cache"""
+        identity_map = _request_identity_map()
+        if identity_map is not None and cache_key in identity_map:
+            return identity_map[cache_key]
+        cached_result = self._get_or_revalidate(
+            cache_key, lambda: self._refresh_query(collection_name, cache_key, queries)
+        )
+        if cached_result is not None:
+            self._remember_query(cache_key, cached_result)
+        return cached_result
+
+    def _remember_query(self, cache_key, page):
+        """Pin a query page for the rest of the request (keys carry their generations)"""
+        identity_map = _request_identity_map()
+        if identity_map is not None:
+            identity_map[cache_key] = page
+
+    def _is_known_missing(self, collection_name, document_id):
+        """True when a recent lookup of this document found nothing"""
+        return self._negatives.contains(collection_name, f"id:{document_id}")
+
+    def _remember_missing(self, collection_name, document_id, generation):
+        """Record a not-found lookup unless a write to the collection raced it"""
+        if generation == self._cache.generation(collection_name):
+            namespace = _document_namespace(collection_name, document_id)
+            # Stays valid until the document's generation moves (a create in any worker)
+            stamp = ('document', namespace, self._cache.generation(namespace))
+            self._negatives.add(collection_name, f"id:{document_id}", {'$id': (document_id,)},
+                                ttl=self._cache_policy(collection_name).negative_ttl, stamp=stamp)
+
+    def _negative_stamp_valid(self, stamp):
+        """Whether a negative entry's generation stamp still holds"""
+        kind, namespace, value = stamp
+        if kind == 'document':
+            return self._cache.generation(namespace) == value
+        # Misses of a whole query: writes from this process invalidate them
+        # precisely (NegativeCache.invalidate); writes from other workers coarsely
+        return self._cache.foreign_generation(namespace) == value
+
+    def _invalidate_queries(self, collection_name, business_id=None):
+        """
+        Drop cached query results a write to the collection may affect: all
+        unscoped ones, plus those scoped to the document's business (or every
+        business when it is unknown).
+        """
+        self._cache.bump_generation(collection_name)
+        if business_id:
+            self._cache.bump_generation(f"{collection_name}@{business_id}")
+        else:
+            self._cache.bump_generation(f"{collection_name}!all")
+
+    def _write_through(self, collection_name, document_id, document):
+        """Refresh (or evict) the cached copy of a document after a write"""
+        if document:
+            business_id = document.get('business_id')
+        else:
+            # Deleted (or unknown outcome): find the business from the old copy if we have it
+            previous = self._cache.get(self._get_cache_key(collection_name, document_id))
+            business_id = previous.get('business_id') if previous else None
+        # Moving the document's generation retires every cached copy of it,
+        # full or projected, in this and (with shared generations) every worker
+        self._cache.bump_generation(_document_namespace(collection_name, document_id))
+        if document:
+            self._store(collection_name, self._get_cache_key(collection_name, document_id), document)
+        # A created or updated document may now satisfy a cached miss; an
+        # unknown outcome (document is None) drops the collection's misses
+        self._negatives.invalidate(collection_name, document)
+        # The rest of this request sees its own write
+        identity_map = _request_identity_map()
+        if identity_map is not None:
+            if document:
+                identity_map[(collection_name, document_id)] = {None: document}
+            else:
+                identity_map.pop((collection_name, document_id), None)
+        self._invalidate_queries(collection_name, business_id)
+
+    def remember_document(self, collection_name, document):
+        """
+        Cache a document the caller knows to be the latest copy, e.g. the last
+        of several concurrent increment results, as if it had just written it.
+        """
+        self._write_through(collection_name, document['$id'], document)
+
+    # Hooks for front ends that make their own Appwrite calls (see
+    # appwrite_async.AsyncAppwriteDB): through these they share this instance's
+    # cache, request identity map, retry policy and invalidation rules.
+
+    def collection_location(self, collection_name):
+        """(database ID, collection ID) of a collection"""
+        self._ensure_initialized()
+        return self.database_id, self.collections[collection_name]
+
+    def read_generation(self, collection_name):
+        """Token to take before fetching from Appwrite and hand to document_read / query_read"""
+        return self._cache.generation(collection_name)
+
+    def cached_document(self, collection_name, document_id, fields=None):
+        """Copy of a document this request or the cache already holds, or None"""
+        return self._get_document_from_cache(collection_name, document_id, fields)
+
+    def known_missing(self, collection_name, document_id):
+        """True when a recent lookup of the document found nothing"""
+        return self._is_known_missing(collection_name, document_id)
+
+    def document_read(self, collection_name, document_id, document, generation, fields=None):
+        """
+        Record a document fetched from Appwrite (None: not found). It is cached
+        unless a write since generation made it stale, and pinned for the request.
+        """
+        if document is None:
+            self._remember_missing(collection_name, document_id, generation)
+            return
+        if generation == self._cache.generation(collection_name):
+            self._store(collection_name, self._get_cache_key(collection_name, document_id, fields=fields), document)
+        self._remember(collection_name, document_id, document, fields)
+
+    def cached_query(self, collection_name, queries, use_cache=True):
+        """
+        (page, cache_key) of a list query: page is the cached {'documents',
+        'total'} or None, cache_key is None when the result may not be cached.
+        """
+        if not use_cache or not self._cache_policy(collection_name).cache_lists:
+            return None, None
+        fingerprint = query_fingerprint(queries)
+        if self._negatives.contains(collection_name, f"query:{fingerprint}"):
+            return {'documents': [], 'total': 0}, None
+        cache_key = self._query_cache_key(collection_name, queries, fingerprint)
+        return self._get_query_from_cache(collection_name, cache_key, queries), cache_key
+
+    def query_read(self, collection_name, queries, cache_key, page, generation):
+        """Record a list query page fetched from Appwrite (cache_key from cached_query)"""
+        if cache_key:
+            self._store(collection_name, cache_key, page)
+            self._remember_query(cache_key, page)
+        self._remember_empty_query(collection_name, queries, page, generation)
+
+    def document_written(self, collection_name, document_id, document):
+        """Refresh the cached document after a write (None: deleted, or the outcome is unknown)"""
+        self._write_through(collection_name, document_id, document)
+
+    def queries_written(self, collection_name, queries):
+        """Drop cached query results a bulk write selected by queries may have changed"""
+        self._invalidate_queries(collection_name, _business_scope(queries))
+
+    async def call_async(self, collection_name, fn, attempts=None, flight=None):
+        """
+        Await fn() (a fresh coroutine per call) under the retry / circuit-breaker
+        policy; concurrent calls with the same flight key share one execution.
+        """
+        if flight is None:
+            return await self._policy.call_async(collection_name, fn, attempts)
+        return await self._flights.do_async(flight, lambda: self._policy.call_async(collection_name, fn, attempts))
+
+    def _call(self, collection_name, fn, attempts=None):
+        """Run one Appwrite API call under the retry / circuit-breaker policy"""
+        return self._policy.call(collection_name, fn, attempts)
+
+    def resilience_stats(self):
+        """Circuit breaker state per collection"""
+        return self._policy.stats()
+
+    def save_cache_snapshot(self, path=CACHE_SNAPSHOT_PATH):
+        """Write the hottest cache entries to disk for the next start"""
+        if not path:
+            return 0
+        skip = tuple(f"{collection_name}:" for collection_name in CACHE_SNAPSHOT_EXCLUDE)
+        saved = self._cache.save_snapshot(path, CACHE_SNAPSHOT_MAX_ENTRIES, skip)
+        logger.info(f"Saved {saved} cache entries to {path}")
+        return saved
+
+    def load_cache_snapshot(self, path=CACHE_SNAPSHOT_PATH):
+        """Warm the cache from a snapshot written by save_cache_snapshot()"""
+        if not path:
+            return 0
+        loaded = self._cache.load_snapshot(path)
+        if loaded:
+            logger.info(f"Warmed cache with {loaded} entries from {path}")
+        return loaded
+
+    def metrics(self):
+        """Cache and circuit-breaker metrics for the process"""
+        return {'cache': self.cache_stats(), 'circuits': self.resilience_stats()}
+
+    def cache_stats(self):
+        """Hit/miss/eviction counters and memory use of the document cache"""
+        stats = self._cache.stats()
+        stats['coalesced'] = self._flights.coalesced
+        stats['negative_entries'] = len(self._negatives)
+        stats['negative_hits'] = self._negatives.hits
+        return stats
         
     def create_document(self, collection_name, data, document_id=None):
         """Create a new document in collection"""
@@ -94,55 +634,218 @@ class AppwriteDB:
             now = get_ist_isoformat()
             data['created_at'] = now
             data['updated_at'] = now
-            result = self.databases.create_document(
-                database_id=self.database_id,
-                collection_id=self.collections[collection_name],
-                document_id=document_id,
-                data=data
-            )
+            attempts = []
+
+            def create():
+                attempts.append(document_id)
+                try:
+                    return self.databases.create_document(
+                        database_id=self.database_id,
+                        collection_id=self.collections[collection_name],
+                        document_id=document_id,
+                        data=data
+                    )
+                except AppwriteException as e:
+                    # A retried create whose first attempt landed: return the stored document
+                    if e.code == 409 and len(attempts) > 1:
+                        return self.databases.get_document(
+                            database_id=self.database_id,
+                            collection_id=self.collections[collection_name],
+                            document_id=document_id
+                        )
+                    raise
+
+            result = self._call(collection_name, create)
+            self._write_through(collection_name, document_id, result)
             return result
         except AppwriteException as e:
             logger.error(f"Appwrite create error: {e}")
             return None
 
-    def get_document(self, collection_name, document_id):
-        """Get a single document by ID with caching"""
+    def get_document(self, collection_name, document_id, fields=None):
+        """Get a single document by ID with caching (optionally only some fields)"""
+        generation = None
         try:
             self._ensure_initialized()
             
             # Check cache first
-            cache_key = self._get_cache_key(collection_name, document_id)
-            cached_result = self._get_from_cache(cache_key)
+            cached_result = self._get_document_from_cache(collection_name, document_id, fields)
             if cached_result is not None:
                 return cached_result
+            if self._is_known_missing(collection_name, document_id):
+                return None
             
-            result = self.databases.get_document(
-                database_id=self.database_id,
-                collection_id=self.collections[collection_name],
-                document_id=document_id
-            )
+            cache_key = self._get_cache_key(collection_name, document_id, fields=fields)
+            generation = self._cache.generation(collection_name)
+            result = self._flights.do(f"{cache_key}@{generation}", lambda: self._call(
+                collection_name, lambda: self.databases.get_document(
+                    database_id=self.database_id,
+                    collection_id=self.collections[collection_name],
+                    document_id=document_id,
+                    queries=[_select_query(fields)] if fields else None
+                )))
             
-            # Cache the result
-            if result:
-                self._set_cache(cache_key, result)
+            # Cache the result unless a write to the collection raced this read
+            if result and generation == self._cache.generation(collection_name):
+                self._store(collection_name, cache_key, result)
+            self._remember(collection_name, document_id, result, fields)
             return result
         except AppwriteException as e:
+            if e.code == 404 and generation is not None:
+                self._remember_missing(collection_name, document_id, generation)
             logger.error(f"Appwrite get error: {e}")
             return None
 
-    def list_documents(self, collection_name, queries=None, limit=100):
-        """List documents with optional queries"""
+    def get_documents(self, collection_name, document_ids, fields=None):
+        """
+        Fetch many documents by ID with as few round trips as possible.
+
+        Cached documents are served directly; the rest are resolved with
+        chunked Query.equal('$id', [...]) list calls. Returns the found
+        documents in the order of document_ids (duplicates and misses dropped).
+        Pass fields to fetch only those attributes.
+        """
+        ordered_ids = [doc_id for doc_id in dict.fromkeys(document_ids or []) if doc_id]
+        found = {}
         try:
             self._ensure_initialized()
-            if queries is None:
-                queries = []
-            queries.append(Query.limit(limit))
-            result = self.databases.list_documents(
+            missing = []
+            for doc_id in ordered_ids:
+                cached_result = self._get_document_from_cache(collection_name, doc_id, fields)
+                if cached_result is not None:
+                    found[doc_id] = cached_result
+                elif not self._is_known_missing(collection_name, doc_id):
+                    missing.append(doc_id)
+
+            for start in range(0, len(missing), BATCH_FETCH_CHUNK_SIZE):
+                chunk = missing[start:start + BATCH_FETCH_CHUNK_SIZE]
+                generation = self._cache.generation(collection_name)
+                chunk_queries = [Query.equal('$id', chunk), Query.limit(len(chunk))]
+                if fields:
+                    chunk_queries.append(_select_query(fields))
+                result = self._call(collection_name, lambda: self.databases.list_documents(
+                    database_id=self.database_id,
+                    collection_id=self.collections[collection_name],
+                    queries=chunk_queries
+                ))
+                for document in result['documents']:
+                    found[document['$id']] = document
+                    self._remember(collection_name, document['$id'], document, fields)
+                    if generation == self._cache.generation(collection_name):
+                        self._store(collection_name, self._get_cache_key(collection_name, document['$id'], fields=fields),
+                                    document)
+                for doc_id in chunk:
+                    if doc_id not in found:
+                        self._remember_missing(collection_name, doc_id, generation)
+
+        except AppwriteException as e:
+            logger.error(f"Appwrite batch get error: {e}")
+        return [found[doc_id] for doc_id in ordered_ids if doc_id in found]
+
+    def _run_list_query(self, collection_name, queries, use_cache=True):
+        """
+        Execute a list query, serving repeated identical queries from cache.
+        Returns {'documents': [...], 'total': <matches ignoring limit/cursor>}.
+        """
+        generation = self.read_generation(collection_name)
+        cached_result, cache_key = self.cached_query(collection_name, queries, use_cache)
+        if cached_result is not None:
+            return {'documents': list(cached_result['documents']), 'total': cached_result['total']}
+
+        def fetch():
+            return self._call(collection_name, lambda: self.databases.list_documents(
                 database_id=self.database_id,
                 collection_id=self.collections[collection_name],
                 queries=queries
-            )
-            return result['documents']
+            ))
+
+        # Cacheable reads coalesce; use_cache=False callers always get their own fresh read
+        result = self._flights.do(cache_key, fetch) if cache_key else fetch()
+        page = {'documents': result['documents'], 'total': result.get('total', len(result['documents']))}
+        self.query_read(collection_name, queries, cache_key, page, generation)
+        return {'documents': list(page['documents']), 'total': page['total']}
+
+    def _remember_empty_query(self, collection_name, queries, page, generation):
+        """Record an empty equality lookup (e.g. phone or PIN checks) as a miss"""
+        if page['documents'] or generation != self._cache.generation(collection_name):
+            return
+        conditions = _equality_conditions(queries)
+        if conditions:
+            stamp = ('foreign', collection_name, self._cache.foreign_generation(collection_name))
+            self._negatives.add(collection_name, f"query:{query_fingerprint(queries)}", conditions,
+                                ttl=self._cache_policy(collection_name).negative_ttl, stamp=stamp)
+
+    def list_page(self, collection_name, queries=None, page_size=25, order_by='created_at',
+                  descending=True, after=None, before=None, use_cache=True, fields=None):
+        """
+        Fetch one keyset page of a query plus the exact match count.
+
+        after/before are page tokens from a previous call, so deep pages cost
+        the same as the first one. Returns {'documents', 'total', 'next', 'prev'}
+        where next/prev are tokens for the neighbouring pages (or None).
+        """
+        try:
+            self._ensure_initialized()
+            plan = PagePlan(queries, page_size, order_by, descending, after, before, fields)
+            try:
+                result = self._run_list_query(collection_name, plan.queries, use_cache)
+            except AppwriteException:
+                if not plan.cursor:
+                    raise
+                # The cursor document was deleted; resume from its sort value instead
+                documents = self._run_list_query(collection_name, plan.value_queries(), use_cache)['documents']
+                total = self._run_list_query(collection_name, plan.count_queries(), use_cache)['total']
+                return plan.page(documents, total, nearest_first=True)
+            return plan.page(result['documents'], result['total'])
+        except AppwriteException as e:
+            logger.error(f"Appwrite page error: {e}")
+            return {'documents': [], 'total': 0, 'next': None, 'prev': None}
+
+    def iter_documents(self, collection_name, queries=None, page_size=STREAM_PAGE_SIZE, fields=None):
+        """
+        Lazily yield every document matching queries, page by page.
+
+        Pages are walked with Query.cursor_after so results are never truncated
+        and deep pages cost the same as the first one; callers may stop early.
+        Any limit/offset/cursor in queries is ignored. Pages are not cached.
+        Pass fields to fetch only those attributes.
+        Unlike list_documents, Appwrite errors are logged and re-raised so a
+        partial walk is never mistaken for a complete one.
+        """
+        self._ensure_initialized()
+        base_queries = _with_projection(
+            [q for q in (queries or []) if _query_method(q) not in PAGING_METHODS], fields
+        )
+        cursor = None
+        while True:
+            page_queries = base_queries + [Query.limit(page_size)]
+            if cursor:
+                page_queries.append(Query.cursor_after(cursor))
+            try:
+                result = self._call(collection_name, lambda: self.databases.list_documents(
+                    database_id=self.database_id,
+                    collection_id=self.collections[collection_name],
+                    queries=page_queries
+                ))
+            except AppwriteException as e:
+                logger.error(f"Appwrite iterate error: {e}")
+                raise
+            documents = result['documents']
+            for document in documents:
+                yield document
+            if len(documents) < page_size:
+                return
+            cursor = documents[-1]['$id']
+
+    def list_documents(self, collection_name, queries=None, limit=100, use_cache=True, fields=None):
+        """List documents with optional queries (optionally only some fields)"""
+        try:
+            self._ensure_initialized()
+            # Copy so the caller's query list is never mutated
+            queries = _with_projection(list(queries) if queries else [], fields)
+            if not any(_query_method(q) == 'limit' for q in queries):
+                queries.append(Query.limit(limit))
+            return self._run_list_query(collection_name, queries, use_cache)['documents']
         except AppwriteException as e:
             logger.error(f"Appwrite list error: {e}")
             return []
@@ -153,65 +856,172 @@ class AppwriteDB:
             self._ensure_initialized()
             from common_utils import get_ist_isoformat
             data['updated_at'] = get_ist_isoformat()
-            result = self.databases.update_document(
+            result = self._call(collection_name, lambda: self.databases.update_document(
                 database_id=self.database_id,
                 collection_id=self.collections[collection_name],
                 document_id=document_id,
                 data=data
-            )
+            ))
+            self._write_through(collection_name, document_id, result)
             return result
         except AppwriteException as e:
             logger.error(f"Appwrite update error: {e}")
+            # The write may or may not have landed, so never serve the old copy
+            self._write_through(collection_name, document_id, None)
+            return None
+
+    def update_documents(self, collection_name, data, queries):
+        """
+        Set the given attributes on every document matching queries in one
+        server-side update, returning the updated documents ([] on error).
+
+        Only the attributes in data are written, so unlike update_document it
+        cannot undo a concurrent increment, and queries can make the write
+        conditional (e.g. only move a timestamp forward).
+        """
+        try:
+            self._ensure_initialized()
+            from common_utils import get_ist_isoformat
+            data['updated_at'] = get_ist_isoformat()
+            result = self._call(collection_name, lambda: self.databases.update_documents(
+                database_id=self.database_id,
+                collection_id=self.collections[collection_name],
+                data=data,
+                queries=queries
+            ))
+            documents = result.get('documents', [])
+            for document in documents:
+                self._write_through(collection_name, document['$id'], document)
+            return documents
+        except AppwriteException as e:
+            logger.error(f"Appwrite bulk update error: {e}")
+            self._invalidate_queries(collection_name, _business_scope(queries))
+            return []
+
+    def increment_document(self, collection_name, document_id, attribute, value):
+        """
+        Atomically add value (negative to subtract) to a numeric attribute on
+        the server, returning the updated document or None.
+
+        Concurrent increments never lose each other's updates. They are not
+        idempotent, so a transient failure is not retried: None then means the
+        outcome is unknown and the caller decides how to verify it.
+        """
+        try:
+            self._ensure_initialized()
+            method = self.databases.increment_document_attribute if value >= 0 else \
+                self.databases.decrement_document_attribute
+            result = self._call(collection_name, lambda: method(
+                database_id=self.database_id,
+                collection_id=self.collections[collection_name],
+                document_id=document_id,
+                attribute=attribute,
+                value=abs(value)
+            ), attempts=1)
+            self._write_through(collection_name, document_id, result)
+            return result
+        except AppwriteException as e:
+            logger.error(f"Appwrite increment error: {e}")
+            self._write_through(collection_name, document_id, None)
             return None
 
     def delete_document(self, collection_name, document_id):
         """Delete a document"""
         try:
             self._ensure_initialized()
-            self.databases.delete_document(
+            self._call(collection_name, lambda: self.databases.delete_document(
                 database_id=self.database_id,
                 collection_id=self.collections[collection_name],
                 document_id=document_id
-            )
+            ))
+            self._write_through(collection_name, document_id, None)
             return True
         except AppwriteException as e:
             logger.error(f"Appwrite delete error: {e}")
+            self._write_through(collection_name, document_id, None)
             return False
 
-    def query_documents(self, collection_name, filters=None, limit=100):
+    def query_documents(self, collection_name, filters=None, limit=100, use_cache=True, fields=None):
         """Query documents with filters"""
         try:
             self._ensure_initialized()
-            queries = []
-            if filters:
-                for key, value in filters.items():
-                    if isinstance(value, dict):
-                        for op, val in value.items():
-                            if op == '$gt':
-                                queries.append(Query.greater_than(key, val))
-                            elif op == '$gte':
-                                queries.append(Query.greater_than_equal(key, val))
-                            elif op == '$lt':
-                                queries.append(Query.less_than(key, val))
-                            elif op == '$lte':
-                                queries.append(Query.less_than_equal(key, val))
-                            elif op == '$ne':
-                                queries.append(Query.not_equal(key, val))
-                    else:
-                        queries.append(Query.equal(key, value))
+            queries = _with_projection(filters_to_queries(filters), fields)
             queries.append(Query.limit(limit))
-            result = self.databases.list_documents(
-                database_id=self.database_id,
-                collection_id=self.collections[collection_name],
-                queries=queries
-            )
-            return result['documents']
+            return self._run_list_query(collection_name, queries, use_cache)['documents']
         except AppwriteException as e:
             logger.error(f"Appwrite query error: {e}")
             return []
 
+# Bounded pool shared by every fan_out call in the process
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix='appwrite-fanout')
+
+# Background stale-while-revalidate refreshes
+_refresh_executor = ThreadPoolExecutor(max_workers=SWR_REFRESH_WORKERS, thread_name_prefix='appwrite-swr')
+
+def fan_out(*calls, timeout=FANOUT_TIMEOUT):
+    """
+    Run independent zero-argument callables concurrently and return their
+    results in order, so a page waits for the slowest call instead of the sum.
+
+    Each call runs in a copy of the caller's context (Flask's request context
+    and flask.g stay visible). The first exception raised by any call is
+    re-raised here; if the deadline passes first, TimeoutError is raised and
+    calls that have not started yet are cancelled. Calls must not fan out
+    themselves, since they would wait on the same bounded pool.
+    """
+    if not calls:
+        return []
+    futures = [_fanout_executor.submit(contextvars.copy_context().run, call) for call in calls]
+    done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    for future in futures:
+        if future in done and future.exception() is not None:
+            for other in pending:
+                other.cancel()
+            raise future.exception()
+    if pending:
+        for future in pending:
+            future.cancel()
+        raise TimeoutError(f"fan_out deadline of {timeout}s exceeded ({len(pending)} of {len(futures)} calls pending)")
+    return [future.result() for future in futures]
+
+# Process-wide AppwriteDB shared by every module, so there is one client, one
+# cache and one set of metrics. Use get_db() rather than building AppwriteDB().
+_shared_db = None
+_shared_db_lock = threading.Lock()
+
+def get_db():
+    """
+    The shared AppwriteDB instance.
+
+    Creating it is cheap and makes no network calls; the Appwrite client is
+    built on the first database operation (see AppwriteDB._ensure_initialized).
+    """
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                _shared_db = AppwriteDB()
+    return _shared_db
+
+_snapshots_enabled = False
+
+def enable_cache_snapshots():
+    """
+    Warm the shared cache from the snapshot left by the last clean shutdown
+    and save a new one at exit. Only the web app calls this, so scripts and
+    jobs neither consume nor overwrite its snapshot. No-op unless
+    CACHE_SNAPSHOT_PATH is set.
+    """
+    global _snapshots_enabled
+    if not CACHE_SNAPSHOT_PATH or _snapshots_enabled:
+        return
+    _snapshots_enabled = True
+    shared_db = get_db()
+    shared_db.load_cache_snapshot()
+    atexit.register(shared_db.save_cache_snapshot)
+
 # Global database instance
-db = AppwriteDB()
+db = get_db()
 
 # Helper functions to replace PostgreSQL operations
 
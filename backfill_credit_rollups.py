@@ -0,0 +1,56 @@
+"""
+Backfill the rollups on customer_credits (credit_total, payment_total,
+transaction_count, last_transaction_at, last_payment_at and current_balance)
+from each business's transactions, then rebuild the business summaries from
+them. Safe to re-run: credits that already match are not written.
+
+Add the new attributes first with setup_appwrite_collections.py, then:
+
+    python backfill_credit_rollups.py                 # every business
+    python backfill_credit_rollups.py <business_id>…  # just these
+"""
+import sys
+import time
+
+from appwrite_utils import get_db
+from business_summary import get_summaries
+from ledger_service import get_ledger
+
+
+def backfill_business(business_id):
+    """Reconcile one business's credits and rebuild its summary; returns the reconcile stats"""
+    stats = get_ledger().reconcile_business(business_id)
+    get_summaries().rebuild(business_id)
+    return stats
+
+
+def main(business_ids=None):
+    if not business_ids:
+        business_ids = (business['$id'] for business in get_db().iter_documents('businesses', fields=['name']))
+
+    started = time.time()
+    totals = {'businesses': 0, 'credits': 0, 'transactions': 0, 'drifted': 0, 'repaired': 0, 'failed': 0}
+    for business_id in business_ids:
+        try:
+            stats = backfill_business(business_id)
+        except Exception as e:
+            print(f"❌ Business {business_id}: {e}")
+            totals['failed'] += 1
+            continue
+        totals['businesses'] += 1
+        # Customers with transactions but no credit document get one created
+        stats['drifted'] += stats['missing']
+        for key in ('credits', 'transactions', 'drifted', 'repaired', 'failed'):
+            totals[key] += stats[key]
+        print(f"✅ Business {business_id}: {stats['credits']} credits, {stats['transactions']} transactions, "
+              f"{stats['repaired']}/{stats['drifted']} drifted credits backfilled")
+
+    print(f"\n🎉 Backfilled {totals['repaired']} of {totals['drifted']} drifted credits "
+          f"({totals['credits']} credits, {totals['transactions']} transactions) across "
+          f"{totals['businesses']} businesses in {time.time() - started:.1f}s")
+    return not totals['failed']
+
+
+if __name__ == "__main__":
+    print("🚀 Backfilling customer credit rollups...")
+    sys.exit(0 if main(sys.argv[1:]) else 1)
@@ -0,0 +1,217 @@
+"""
+Materialized per-business totals for the dashboard header.
+
+One business_summaries document per business (its document ID is the business
+ID) holds customer_count, total_outstanding (the sum of positive customer
+balances), credit_total, payment_total and last_activity_at. The ledger keeps
+it current with atomic increments on every write, so the dashboard reads one
+cached document however large the business's ledger grows.
+
+rebuild() recomputes a summary from the rollups on customer_credits (see
+ledger_service.ROLLUP_FIELDS), falling back to the business's transactions
+while its credits are not backfilled; it runs when a summary does not exist
+yet or an increment to it failed.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from appwrite.query import Query
+
+from appwrite_utils import get_db
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLLECTION = 'business_summaries'
+
+# Increment-maintained summary attributes
+SUMMARY_COUNTERS = ('customer_count', 'total_outstanding', 'credit_total', 'payment_total')
+
+
+def outstanding_delta(old_balance, new_balance):
+    """Change to total_outstanding when a customer's balance moves (only positive balances count)"""
+    return max(new_balance, 0.0) - max(old_balance, 0.0)
+
+
+class BusinessSummaries:
+    def __init__(self, db=None):
+        self._db = db or get_db()
+        # Businesses whose summary document is known to exist
+        self._existing = set()
+        self._existing_lock = threading.Lock()
+        # Businesses with a background rebuild queued
+        self._rebuilding = set()
+        self._rebuilding_lock = threading.Lock()
+
+    def get(self, business_id):
+        """The business's summary document (rebuilt first if it does not exist)"""
+        summary = self._db.get_document(SUMMARY_COLLECTION, business_id)
+        if summary is None:
+            summary = self.rebuild(business_id)
+        else:
+            self._mark_existing(business_id)
+        return summary
+
+    def ensure(self, business_id):
+        """Make sure the summary exists before increments are aimed at it"""
+        with self._existing_lock:
+            if business_id in self._existing:
+                return
+        self.get(business_id)
+
+    def _mark_existing(self, business_id, exists=True):
+        with self._existing_lock:
+            if exists:
+                if len(self._existing) > 100000:
+                    self._existing.clear()
+                self._existing.add(business_id)
+            else:
+                self._existing.discard(business_id)
+
+    def rebuild(self, business_id):
+        """
+        Recompute the summary from the business's credit rollups and store it.
+        An increment landing while this runs can be overwritten, so it is a
+        repair path, not part of normal writes.
+
+        Credits not backfilled yet (see backfill_credit_rollups.py) carry no
+        rollups, so the lifetime totals then come from a scan of the
+        business's transactions instead.
+        """
+        customer_count = 0
+        total_outstanding = 0.0
+        credit_total = 0.0
+        payment_total = 0.0
+        last_activity_at = None
+        backfilled = True
+        for credit in self._db.iter_documents('customer_credits', [
+            Query.equal('business_id', business_id)
+        ], fields=['current_balance', 'credit_total', 'payment_total', 'last_transaction_at']):
+            customer_count += 1
+            total_outstanding += max(float(credit.get('current_balance') or 0), 0.0)
+            credit_total += float(credit.get('credit_total') or 0)
+            payment_total += float(credit.get('payment_total') or 0)
+            last_transaction_at = credit.get('last_transaction_at')
+            if last_transaction_at is None:
+                # Either no transactions or not backfilled: only the transactions can tell
+                backfilled = False
+            elif last_activity_at is None or last_transaction_at > last_activity_at:
+                last_activity_at = last_transaction_at
+
+        if not backfilled:
+            credit_total, payment_total, last_activity_at = self._transaction_totals(business_id)
+
+        data = {
+            'customer_count': customer_count,
+            'total_outstanding': total_outstanding,
+            'credit_total': credit_total,
+            'payment_total': payment_total,
+            'last_activity_at': last_activity_at
+        }
+        if self._db.get_document(SUMMARY_COLLECTION, business_id) is not None:
+            summary = self._db.update_document(SUMMARY_COLLECTION, business_id, data)
+        else:
+            summary = self._db.create_document(SUMMARY_COLLECTION, dict(data, business_id=business_id),
+                                               document_id=business_id)
+        if summary is not None:
+            self._mark_existing(business_id)
+            logger.info(f"Rebuilt summary for business {business_id}: {customer_count} customers, "
+                        f"outstanding {total_outstanding}")
+        return summary
+
+    def _transaction_totals(self, business_id):
+        """(credit_total, payment_total, last_activity_at) from a scan of the business's transactions"""
+        credit_total = 0.0
+        payment_total = 0.0
+        last_activity_at = None
+        for transaction in self._db.iter_documents('transactions', [
+            Query.equal('business_id', business_id)
+        ], fields=['amount', 'transaction_type', 'created_at']):
+            if transaction.get('transaction_type') == 'credit':
+                credit_total += float(transaction.get('amount', 0))
+            elif transaction.get('transaction_type') == 'payment':
+                payment_total += float(transaction.get('amount', 0))
+            created_at = transaction.get('created_at')
+            if created_at and (last_activity_at is None or created_at > last_activity_at):
+                last_activity_at = created_at
+        return credit_total, payment_total, last_activity_at
+
+    def enqueue_rebuild(self, business_id):
+        """Rebuild a summary in the background (at most one queued run per business)"""
+        with self._rebuilding_lock:
+            if business_id in self._rebuilding:
+                return False
+            self._rebuilding.add(business_id)
+
+        def run():
+            try:
+                self.rebuild(business_id)
+            except Exception as e:
+                logger.warning(f"Rebuilding summary for business {business_id} failed: {e}")
+            finally:
+                with self._rebuilding_lock:
+                    self._rebuilding.discard(business_id)
+
+        _rebuild_executor.submit(run)
+        return True
+
+    def _increment(self, business_id, attribute, value):
+        result = self._db.increment_document(SUMMARY_COLLECTION, business_id, attribute, value)
+        if result is None:
+            # Lost or unknown: recompute rather than guess
+            self._mark_existing(business_id, False)
+            self.enqueue_rebuild(business_id)
+        return result
+
+    def _touch(self, business_id, activity_at):
+        """Move last_activity_at forward (never back), without rewriting the counters"""
+        documents = self._db.update_documents(SUMMARY_COLLECTION, {'last_activity_at': activity_at}, [
+            Query.equal('$id', business_id),
+            Query.or_queries([Query.is_null('last_activity_at'), Query.less_than('last_activity_at', activity_at)])
+        ])
+        return documents[0] if documents else None
+
+    def adjustments(self, business_id, customers=0, outstanding=0.0, credit=0.0, payment=0.0, activity_at=None):
+        """
+        Zero-argument callables applying the given changes, for the caller to
+        run concurrently with its own writes (see LedgerService.record_transaction).
+        Each returns the updated summary document or None.
+        """
+        calls = []
+        for attribute, value in zip(SUMMARY_COUNTERS, (customers, outstanding, credit, payment)):
+            if value:
+                calls.append(lambda attribute=attribute, value=value: self._increment(business_id, attribute, value))
+        if activity_at:
+            calls.append(lambda: self._touch(business_id, activity_at))
+        return calls
+
+    def adjust(self, business_id, **changes):
+        """Apply changes one after another (for paths that are not latency-critical); returns the results"""
+        summaries = [call() for call in self.adjustments(business_id, **changes)]
+        self.settle(summaries)
+        return summaries
+
+    def settle(self, summaries):
+        """After concurrent changes, cache the copy Appwrite stamped last"""
+        summaries = [summary for summary in summaries if summary]
+        if len(summaries) > 1:
+            latest = max(summaries, key=lambda summary: summary.get('$updatedAt') or '')
+            self._db.remember_document(SUMMARY_COLLECTION, latest)
+
+
+# Background rebuilds queued by failed increments
+_rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summary-rebuild')
+
+# One summary store per process, sharing the process's AppwriteDB
+_summaries = None
+_summaries_lock = threading.Lock()
+
+
+def get_summaries():
+    """The shared BusinessSummaries instance"""
+    global _summaries
+    if _summaries is None:
+        with _summaries_lock:
+            if _summaries is None:
+                _summaries = BusinessSummaries()
+    return _summaries
@@ -54,11 +54,13 @@ def get_ist_isoformat():
 
 # Appwrite Configuration
 from appwrite_config import AppwriteConfig
-from appwrite_utils import AppwriteDB
+from appwrite_utils import get_db
+# Retry settings live with the rest of the tuning knobs (used by the shared AppwriteDB's retry policy)
+from performance_config import DB_RETRY_ATTEMPTS, DB_RETRY_DELAY
 
 # Initialize Appwrite
 appwrite_config = AppwriteConfig()
-appwrite_db = AppwriteDB()
+appwrite_db = get_db()
 
 # Set environment variables from hardcoded values only if not already set
 
@@ -85,15 +87,11 @@ if RENDER_DEPLOYMENT:
     qrcode = None
     
     # Aggressive performance settings for Render
-    DB_RETRY_ATTEMPTS = 2
-    DB_RETRY_DELAY = 1.0
     DB_QUERY_TIMEOUT = 30  # Increase timeout to prevent worker timeouts
     RENDER_QUERY_LIMIT = 10  # Limit number of results returned in queries
     RENDER_DASHBOARD_LIMIT = 5  # Limit items shown on dashboard
 else:
     # Normal settings for development
-    DB_RETRY_ATTEMPTS = 3
-    DB_RETRY_DELAY = 1  # seconds
     DB_QUERY_TIMEOUT = 5  # seconds
     RENDER_QUERY_LIMIT = 50  # Higher limit for local development
     RENDER_DASHBOARD_LIMIT = 10  # Higher limit for local development
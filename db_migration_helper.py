@@ -3,12 +3,12 @@ Database Migration Helper for App.py
 This file contains replacement functions for all database operations
 """
 
-from appwrite_utils import AppwriteDB
+from appwrite_utils import get_db
 from datetime import datetime
 from appwrite.query import Query
 
-# Initialize Appwrite DB
-appwrite_db = AppwriteDB()
+# Shared Appwrite DB (same client and cache as the app)
+appwrite_db = get_db()
 
 def execute_query_replacement(query, params=None, fetch_one=False, commit=True):
     """
@@ -103,24 +103,16 @@ def handle_select_query(query, params=None, fetch_one=False):
     try:
         # Execute query
         if fetch_one or 'limit 1' in query_lower:
-            result = appwrite_db.databases.list_documents(
-                database_id=appwrite_db.config.database_id,
-                collection_id=appwrite_db.config.collections[collection],
-                queries=queries
-            )
-            if result['documents']:
+            documents = appwrite_db.list_documents(collection, queries)
+            if documents:
                 # Convert Appwrite document to dict-like object for compatibility
-                doc = result['documents'][0]
+                doc = documents[0]
                 return dict(doc)
             return None
         else:
-            result = appwrite_db.databases.list_documents(
-                database_id=appwrite_db.config.database_id,
-                collection_id=appwrite_db.config.collections[collection],
-                queries=queries
-            )
+            documents = appwrite_db.list_documents(collection, queries)
             # Convert all documents to dict-like objects
-            return [dict(doc) for doc in result['documents']]
+            return [dict(doc) for doc in documents]
     
     except Exception as e:
         print(f"Error in SELECT query: {e}")
@@ -202,13 +194,9 @@ def handle_insert_query(query, params=None):
     
     try:
         # Create document in Appwrite
-        result = appwrite_db.databases.create_document(
-            database_id=appwrite_db.config.database_id,
-            collection_id=appwrite_db.config.collections[collection],
-            document_id=document_id or 'unique()',
-            data=document_data
-        )
-        return dict(result)
+        # Goes through the shared cache so app reads see the new document
+        result = appwrite_db.create_document(collection, document_data, document_id)
+        return dict(result) if result else None
     
     except Exception as e:
         print(f"Error in INSERT query: {e}")
@@ -2,11 +2,11 @@
 
 import os
 import sys
-from appwrite_utils import AppwriteDB
+from appwrite_utils import get_db
 
 def main():
     # Initialize Appwrite
-    appwrite_db = AppwriteDB()
+    appwrite_db = get_db()
     
     # Get the transaction that's causing issues
     transaction_id = "396f000f-f755-4085-b6c1-8980b38267ba"
@@ -0,0 +1,603 @@
+"""
+Ledger write path: record a transaction and move the customer's balance.
+
+A transaction used to cost three sequential round trips (create the
+transaction, look up customer_credits, write the new balance) and the balance
+was a read-modify-write, so two concurrent entries for one customer could lose
+an update. LedgerService instead:
+
+- applies the balance change as an atomic server-side increment, so concurrent
+  writers (other threads, workers or hosts) never overwrite each other;
+- creates the transaction and increments the balance concurrently, on a pool
+  of its own, so a write costs one round trip of latency; every sub-write is
+  waited for (none is cancelled by a deadline once others may have landed);
+- remembers each (business, customer) credit document ID, so the lookup query
+  is paid once per process;
+- serializes writes to one (business, customer) inside the process with striped
+  locks, and uses the credit's $updatedAt as a version to decide whether an
+  increment whose outcome is unknown (timeout, dropped connection) landed
+  before it is applied again, so balances never drift by a double count.
+
+Each write also moves the business's summary document (see business_summary)
+and the credit's rollups (ROLLUP_FIELDS: credit and payment totals,
+transaction_count, last transaction and payment times) in the same round trip,
+so listing and reminder pages read customer_credits alone. Read paths compare
+transaction_count with the transaction total they already fetch and, only when
+the two disagree, queue a background reconcile() that recomputes the rollups
+from the transactions; they never rewrite balances themselves.
+
+    ledger = get_ledger()
+    transaction = ledger.record_transaction(business_id, customer_id, 250.0, 'credit', notes='Rice')
+"""
+import contextvars
+import logging
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from appwrite.query import Query
+
+from appwrite_utils import get_db
+from business_summary import BusinessSummaries, get_summaries, outstanding_delta
+from performance_config import (LEDGER_LOCK_STRIPES, LEDGER_CREDIT_CACHE_SIZE, LEDGER_RECONCILE_WORKERS,
+                                LEDGER_RECONCILE_BATCH_SIZE, LEDGER_WRITE_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+
+def balance_delta(amount, transaction_type):
+    """Change to current_balance for a transaction: credits add, payments subtract"""
+    return amount if transaction_type == 'credit' else -amount
+
+
+def credit_document_id(business_id, customer_id):
+    """Deterministic ID for a new credit document, so racing creators collide instead of duplicating"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"customer_credits/{business_id}/{customer_id}"))
+
+
+# customer_credits attributes derived from the customer's transactions
+ROLLUP_FIELDS = ('current_balance', 'credit_total', 'payment_total', 'transaction_count',
+                 'last_transaction_at', 'last_payment_at')
+
+# Running total moved by each transaction type
+ROLLUP_TOTALS = {'credit': 'credit_total', 'payment': 'payment_total'}
+
+# The write path stamps its own clock, a moment before Appwrite stamps the
+# transaction's created_at, so timestamps this close count as equal
+ROLLUP_TIMESTAMP_TOLERANCE = 5  # seconds
+
+# Scans reconcile() makes before giving up on a credit that keeps moving under it
+RECONCILE_ATTEMPTS = 3
+
+
+def empty_rollup():
+    """Rollups of a customer with no transactions"""
+    return {
+        'current_balance': 0.0,
+        'credit_total': 0.0,
+        'payment_total': 0.0,
+        'transaction_count': 0,
+        'last_transaction_at': None,
+        'last_payment_at': None
+    }
+
+
+def add_to_rollup(rollup, transaction):
+    """Fold one transaction (amount, transaction_type, created_at) into rollup; returns rollup"""
+    amount = float(transaction.get('amount') or 0)
+    transaction_type = transaction.get('transaction_type')
+    created_at = transaction.get('created_at')
+    rollup['current_balance'] += balance_delta(amount, transaction_type)
+    if transaction_type in ROLLUP_TOTALS:
+        rollup[ROLLUP_TOTALS[transaction_type]] += amount
+    rollup['transaction_count'] += 1
+    if created_at:
+        if _parse_time(created_at) > _parse_time(rollup['last_transaction_at']):
+            rollup['last_transaction_at'] = created_at
+        if transaction_type == 'payment' and _parse_time(created_at) > _parse_time(rollup['last_payment_at']):
+            rollup['last_payment_at'] = created_at
+    return rollup
+
+
+def rollup_drift(credit, rollup):
+    """
+    The ROLLUP_FIELDS on which a credit document disagrees with rollup. A
+    missing counter is drift even when it should be 0: Appwrite does not fill
+    attribute defaults into documents created before the attribute existed.
+    """
+    drifted = []
+    for field in ROLLUP_FIELDS:
+        stored, expected = credit.get(field), rollup[field]
+        if field.endswith('_at'):
+            if bool(stored) != bool(expected) or (stored and abs(
+                    (_parse_time(stored) - _parse_time(expected)).total_seconds()) > ROLLUP_TIMESTAMP_TOLERANCE):
+                drifted.append(field)
+        elif stored is None:
+            drifted.append(field)
+        elif field == 'transaction_count':
+            if stored != expected:
+                drifted.append(field)
+        elif abs(float(stored) - expected) >= 0.005:
+            drifted.append(field)
+    return drifted
+
+
+def _parse_time(value):
+    """Aware datetime for an ISO timestamp (None sorts first)"""
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.astimezone()
+
+
+class LedgerService:
+    def __init__(self, db=None, stripes=LEDGER_LOCK_STRIPES, cache_size=LEDGER_CREDIT_CACHE_SIZE, summaries=None):
+        self._db = db or get_db()
+        # Per-business totals moved alongside every balance change
+        self._summaries = summaries or BusinessSummaries(self._db)
+        self._locks = [threading.Lock() for _ in range(max(1, stripes))]
+        # (business_id, customer_id) -> {'id', 'balance', 'version'} of the credit
+        # document, as of this process's last read or write of it
+        self._credits = OrderedDict()
+        self._credits_lock = threading.Lock()
+        self._cache_size = cache_size
+        # Customers with a background reconciliation queued
+        self._reconciling = set()
+        self._reconciling_lock = threading.Lock()
+
+    def _lock_for(self, business_id, customer_id):
+        return self._locks[zlib.crc32(f"{business_id}:{customer_id}".encode('utf-8')) % len(self._locks)]
+
+    def _remember_credit(self, business_id, customer_id, credit):
+        """Cache the credit document's ID, balance and version"""
+        key = (business_id, customer_id)
+        with self._credits_lock:
+            if credit:
+                self._credits[key] = {
+                    'id': credit['$id'],
+                    'balance': float(credit.get('current_balance', 0)),
+                    'version': credit.get('$updatedAt'),
+                }
+                self._credits.move_to_end(key)
+                while len(self._credits) > self._cache_size:
+                    self._credits.popitem(last=False)
+            else:
+                self._credits.pop(key, None)
+
+    def _known_credit(self, business_id, customer_id):
+        with self._credits_lock:
+            known = self._credits.get((business_id, customer_id))
+            return dict(known) if known else None
+
+    def _find_credit(self, business_id, customer_id, use_cache=True):
+        """The (business, customer) credit document from Appwrite, or None"""
+        credits = self._db.list_documents('customer_credits', [
+            Query.equal('business_id', business_id),
+            Query.equal('customer_id', customer_id),
+            Query.limit(1)
+        ], use_cache=use_cache)
+        credit = credits[0] if credits else None
+        self._remember_credit(business_id, customer_id, credit)
+        return credit
+
+    def _apply_delta(self, business_id, customer_id, delta):
+        """
+        Add delta to the customer's balance, creating the credit document if
+        there is none. Returns the updated credit document, or None when the
+        outcome could not be established (the balance may need reconciling).
+        Call with the (business, customer) lock held.
+        """
+        known = self._known_credit(business_id, customer_id)
+        if known is None:
+            credit = self._find_credit(business_id, customer_id)
+            if credit is None:
+                # Callers move the other rollups themselves (see record_transaction)
+                return self._create_credit(business_id, customer_id, dict(empty_rollup(), current_balance=delta))
+            known = self._known_credit(business_id, customer_id)
+
+        result = self._db.increment_document('customer_credits', known['id'], 'current_balance', delta)
+        if result is None:
+            result = self._recover_increment(business_id, customer_id, known, delta)
+        if result is not None:
+            self._remember_credit(business_id, customer_id, result)
+        return result
+
+    def _recover_increment(self, business_id, customer_id, known, delta):
+        """
+        An increment failed without a definite answer: check the credit's
+        version to see whether it landed, and apply it once more only if it
+        provably did not.
+        """
+        current = self._db.get_document('customer_credits', known['id'])
+        if current is None:
+            # The cached credit document is gone (or unreachable): look it up again
+            self._remember_credit(business_id, customer_id, None)
+            credit = self._find_credit(business_id, customer_id, use_cache=False)
+            if credit is None:
+                # Its other rollups are a guess; the drift check reconciles them
+                return self._create_credit(business_id, customer_id,
+                                           dict(empty_rollup(), current_balance=delta, transaction_count=1))
+            return self._db.increment_document('customer_credits', credit['$id'], 'current_balance', delta)
+        if known['version'] and current.get('$updatedAt') == known['version']:
+            # Unchanged since our last view: the increment never reached the server
+            return self._db.increment_document('customer_credits', known['id'], 'current_balance', delta)
+        if abs(float(current.get('current_balance', 0)) - (known['balance'] + delta)) < 0.005:
+            # Moved by exactly our delta: it landed
+            return current
+        logger.warning(f"Balance for customer {customer_id} of business {business_id} is uncertain after a "
+                       f"failed increment of {delta}; it needs reconciling")
+        self._remember_credit(business_id, customer_id, None)
+        return None
+
+    def _create_credit(self, business_id, customer_id, rollup):
+        """
+        Create the credit document with opening rollups (or add them to the
+        one a racer created) and count it in the business summary.
+        """
+        data = {field: value for field, value in rollup.items() if value is not None}
+        credit = self._db.create_document('customer_credits', dict(
+            data, business_id=business_id, customer_id=customer_id
+        ), document_id=credit_document_id(business_id, customer_id))
+        if credit is not None:
+            self._summaries.adjust(business_id, customers=1,
+                                   outstanding=outstanding_delta(0.0, rollup['current_balance']))
+        else:
+            # Another worker created it first
+            existing = self._find_credit(business_id, customer_id, use_cache=False)
+            if existing is None:
+                return None
+            balance = rollup['current_balance']
+            credit = self._db.increment_document('customer_credits', existing['$id'], 'current_balance', balance)
+            if credit is None:
+                return None
+            new_balance = float(credit.get('current_balance', 0))
+            self._summaries.adjust(business_id, outstanding=outstanding_delta(new_balance - balance, new_balance))
+            for field in ('credit_total', 'payment_total', 'transaction_count'):
+                if rollup[field]:
+                    credit = self._increment_rollup(existing['$id'], field, rollup[field]) or credit
+            for field in ('last_transaction_at', 'last_payment_at'):
+                if rollup[field]:
+                    credit = self._stamp_rollup(existing['$id'], field, rollup[field]) or credit
+        self._remember_credit(business_id, customer_id, credit)
+        return credit
+
+    def _increment_rollup(self, credit_id, field, value):
+        """Move one of the credit's counters (transaction_count is also the drift signal read by the customer page)"""
+        return self._db.increment_document('customer_credits', credit_id, field, value)
+
+    def _stamp_rollup(self, credit_id, field, at):
+        """Move one of the credit's timestamps forward (never back), without rewriting its counters"""
+        credits = self._db.update_documents('customer_credits', {field: at}, [
+            Query.equal('$id', credit_id),
+            Query.or_queries([Query.is_null(field), Query.less_than(field, at)])
+        ])
+        return credits[0] if credits else None
+
+    def _rollup_calls(self, credit_id, amount, transaction_type, at):
+        """
+        Zero-argument callables moving the credit's rollups for one transaction,
+        in a fixed order: transaction_count, the type's total, then timestamps.
+        """
+        calls = [lambda: self._increment_rollup(credit_id, 'transaction_count', 1)]
+        if transaction_type in ROLLUP_TOTALS:
+            calls.append(lambda: self._increment_rollup(credit_id, ROLLUP_TOTALS[transaction_type], amount))
+        calls.append(lambda: self._stamp_rollup(credit_id, 'last_transaction_at', at))
+        if transaction_type == 'payment':
+            calls.append(lambda: self._stamp_rollup(credit_id, 'last_payment_at', at))
+        return calls
+
+    def _settle(self, business_id, customer_id, *credits):
+        """
+        After concurrent increments of one credit, cache the copy that saw
+        all of them: the one Appwrite stamped last.
+        """
+        credits = [credit for credit in credits if credit]
+        if len(credits) > 1:
+            latest = max(credits, key=lambda credit: credit.get('$updatedAt') or '')
+            self._db.remember_document('customer_credits', latest)
+            self._remember_credit(business_id, customer_id, latest)
+
+    def record_transaction(self, business_id, customer_id, amount, transaction_type, notes='',
+                           created_by=None, receipt_image_url=None):
+        """
+        Create a transaction and apply it to the customer's balance and rollups.
+
+        Returns the transaction document whenever it was created, even if part
+        of the balance or rollup update failed (that customer is then
+        reconciled in the background), or None when it could not be created
+        (any balance change already applied for it is reversed).
+        """
+        transaction_data = {
+            'business_id': str(business_id),
+            'customer_id': str(customer_id),
+            'amount': amount,
+            'transaction_type': transaction_type,
+            'notes': notes,
+            'created_by': str(created_by)
+        }
+        if receipt_image_url:
+            transaction_data['receipt_image_url'] = receipt_image_url
+        delta = balance_delta(amount, transaction_type)
+        totals = {'credit': amount} if transaction_type == 'credit' else {'payment': amount}
+        from common_utils import get_ist_isoformat
+        activity_at = get_ist_isoformat()
+
+        with self._lock_for(business_id, customer_id):
+            # Usually answered from memory; a lookup only on this process's first write for the customer
+            known = self._known_credit(business_id, customer_id)
+            if known is None and self._find_credit(business_id, customer_id) is not None:
+                known = self._known_credit(business_id, customer_id)
+            self._summaries.ensure(business_id)
+
+            if known is None:
+                # A new customer: _create_credit also counts them in the summary
+                outstanding = 0.0
+                opening = add_to_rollup(empty_rollup(), {
+                    'amount': amount, 'transaction_type': transaction_type, 'created_at': activity_at
+                })
+                transaction, credit, *summaries = _write_all(
+                    lambda: self._db.create_document('transactions', transaction_data),
+                    lambda: self._create_credit(business_id, customer_id, opening),
+                    *self._summaries.adjustments(business_id, activity_at=activity_at, **totals)
+                )
+                counted = credit
+                totaled = credit if transaction_type in ROLLUP_TOTALS else None
+                if credit is not None:
+                    new_balance = float(credit.get('current_balance', 0))
+                    outstanding = outstanding_delta(new_balance - delta, new_balance)
+            else:
+                # Predict the outstanding change from the last balance seen; corrected below if it moved meanwhile
+                outstanding = outstanding_delta(known['balance'], known['balance'] + delta)
+                rollup_calls = self._rollup_calls(known['id'], amount, transaction_type, activity_at)
+                transaction, credit, *results = _write_all(
+                    lambda: self._db.create_document('transactions', transaction_data),
+                    lambda: self._apply_delta(business_id, customer_id, delta),
+                    *rollup_calls,
+                    *self._summaries.adjustments(business_id, outstanding=outstanding,
+                                                 activity_at=activity_at, **totals)
+                )
+                rollups, summaries = results[:len(rollup_calls)], results[len(rollup_calls):]
+                counted = rollups[0]
+                totaled = rollups[1] if transaction_type in ROLLUP_TOTALS else None
+                self._settle(business_id, customer_id, credit, *rollups)
+                if credit is not None:
+                    new_balance = float(credit.get('current_balance', 0))
+                    actual = outstanding_delta(new_balance - delta, new_balance)
+                    if abs(actual - outstanding) >= 0.005:
+                        summaries.extend(self._summaries.adjust(business_id, outstanding=actual - outstanding))
+                    outstanding = actual
+            self._summaries.settle(summaries)
+
+            if transaction is None:
+                # Keep the balance, counters and summary equal to the sum of recorded transactions
+                # (a timestamp already moved forward is left for the drift check)
+                logger.warning(f"Transaction create failed; reversing balance change of {delta} "
+                               f"for customer {customer_id}")
+                if credit is not None:
+                    reversed_credit = self._apply_delta(business_id, customer_id, -delta)
+                    if reversed_credit is not None:
+                        if counted is not None:
+                            self._increment_rollup(reversed_credit['$id'], 'transaction_count', -1)
+                        if totaled is not None:
+                            self._increment_rollup(reversed_credit['$id'], ROLLUP_TOTALS[transaction_type], -amount)
+                self._summaries.adjust(business_id, outstanding=-outstanding,
+                                       **{key: -value for key, value in totals.items()})
+        if transaction is not None and (credit is None or counted is None or
+                                        (transaction_type in ROLLUP_TOTALS and totaled is None)):
+            logger.error(f"Transaction {transaction['$id']} recorded but its balance or rollup update failed for "
+                         f"customer {customer_id} of business {business_id}; reconciling")
+            self.enqueue_reconcile(business_id, customer_id)
+        return transaction
+
+    def open_account(self, business_id, customer_id, opening_balance=0.0):
+        """Create a customer's credit document with an opening balance; returns it or None"""
+        with self._lock_for(business_id, customer_id):
+            self._summaries.ensure(business_id)
+            return self._create_credit(business_id, customer_id,
+                                       dict(empty_rollup(), current_balance=opening_balance))
+
+    def reconcile(self, business_id, customer_id):
+        """
+        Recompute a customer's rollups from their transactions and write them
+        to the credit document if they drifted.
+
+        The credit is read before the transactions and written only if it is
+        still that version (see _write_rollup), so a write from another worker
+        or host landing during the scan is never overwritten: the credit is
+        read and scanned again instead, up to RECONCILE_ATTEMPTS times.
+
+        Returns {'balance', 'transaction_count', 'changed'}.
+        """
+        with self._lock_for(business_id, customer_id):
+            for attempt in range(RECONCILE_ATTEMPTS):
+                credit = self._find_credit(business_id, customer_id, use_cache=False)
+                rollup = empty_rollup()
+                for transaction in self._db.iter_documents('transactions', [
+                    Query.equal('business_id', business_id),
+                    Query.equal('customer_id', customer_id)
+                ], fields=['amount', 'transaction_type', 'created_at']):
+                    add_to_rollup(rollup, transaction)
+
+                if credit is None:
+                    changed = bool(rollup['transaction_count']) and \
+                        self._create_credit(business_id, customer_id, rollup) is not None
+                    break
+                if not rollup_drift(credit, rollup):
+                    changed = False
+                    break
+                updated = self._write_rollup(credit, rollup)
+                if updated is not None:
+                    self._remember_credit(business_id, customer_id, updated)
+                    # The write replaced exactly the balance read, so that is what the summary counted
+                    self._summaries.adjust(business_id, outstanding=outstanding_delta(
+                        float(credit.get('current_balance') or 0), rollup['current_balance']))
+                    changed = True
+                    break
+                logger.info(f"Credit of customer {customer_id} of business {business_id} changed while "
+                            f"reconciling (attempt {attempt + 1}); scanning again")
+            else:
+                changed = False
+                logger.warning(f"Could not reconcile customer {customer_id} of business {business_id}: its credit "
+                               f"kept changing; the next drift check queues it again")
+            if changed:
+                logger.info(f"Reconciled customer {customer_id} of business {business_id}: "
+                            f"balance {rollup['current_balance']}, {rollup['transaction_count']} transactions")
+            return {'balance': rollup['current_balance'], 'transaction_count': rollup['transaction_count'],
+                    'changed': changed}
+
+    def _write_rollup(self, credit, rollup):
+        """
+        Overwrite a credit's rollups only if it is still the version read
+        (its $updatedAt is unchanged); returns the updated document or None.
+        """
+        if not credit.get('$updatedAt'):
+            return None
+        credits = self._db.update_documents('customer_credits', dict(rollup), [
+            Query.equal('$id', credit['$id']),
+            Query.equal('$updatedAt', credit['$updatedAt'])
+        ])
+        return credits[0] if credits else None
+
+    def reconcile_business(self, business_id, batch_size=LEDGER_RECONCILE_BATCH_SIZE, dry_run=False, executor=None):
+        """
+        Check every credit of a business against one scan of its transactions
+        and write back only the ones whose rollups drifted, batch_size
+        concurrent writes at a time.
+
+        Credits are read before the transactions and each write is conditional
+        on the credit's $updatedAt, so a credit the ledger moved during the
+        scan is not overwritten: it is recounted under its lock by reconcile()
+        instead, as are customers with transactions but no credit document.
+        Batches run on executor (a shared pool of batch_size threads by
+        default) and are waited for in full. dry_run only reports.
+
+        Returns {'credits', 'transactions', 'drifted', 'missing', 'repaired',
+        'recounted', 'failed', 'balance_drift', 'fields'}: balance_drift is the
+        summed absolute balance error, fields counts drifted credits per field.
+        """
+        credits = {}
+        for credit in self._db.iter_documents('customer_credits', [
+            Query.equal('business_id', business_id)
+        ], fields=['customer_id', '$updatedAt', *ROLLUP_FIELDS]):
+            if credit.get('customer_id'):
+                credits[credit['customer_id']] = credit
+
+        rollups = {}
+        transaction_count = 0
+        for transaction in self._db.iter_documents('transactions', [
+            Query.equal('business_id', business_id)
+        ], fields=['customer_id', 'amount', 'transaction_type', 'created_at']):
+            customer_id = transaction.get('customer_id')
+            if customer_id:
+                add_to_rollup(rollups.setdefault(customer_id, empty_rollup()), transaction)
+                transaction_count += 1
+
+        stats = {'credits': len(credits), 'transactions': transaction_count, 'drifted': 0, 'missing': 0,
+                 'repaired': 0, 'recounted': 0, 'failed': 0, 'balance_drift': 0.0, 'fields': {}}
+        repairs = []
+        for customer_id, credit in credits.items():
+            rollup = rollups.get(customer_id) or empty_rollup()
+            drifted = rollup_drift(credit, rollup)
+            if drifted:
+                repairs.append((credit, rollup))
+                stats['balance_drift'] += abs(float(credit.get('current_balance') or 0) - rollup['current_balance'])
+                for field in drifted:
+                    stats['fields'][field] = stats['fields'].get(field, 0) + 1
+        recounts = [customer_id for customer_id in rollups if customer_id not in credits]
+        stats['drifted'] = len(repairs)
+        stats['missing'] = len(recounts)
+        stats['balance_drift'] += sum(abs(rollups[customer_id]['current_balance']) for customer_id in recounts)
+        if dry_run:
+            return stats
+
+        outstanding = 0.0
+        for start in range(0, len(repairs), max(1, batch_size)):
+            batch = repairs[start:start + max(1, batch_size)]
+            # A write that failed or raised yields None and is recounted below
+            results = _write_all(*[lambda credit=credit, rollup=rollup: self._write_rollup(credit, rollup)
+                                   for credit, rollup in batch], executor=executor or _repair_executor)
+            for (credit, rollup), updated in zip(batch, results):
+                if updated is None:
+                    recounts.append(credit['customer_id'])
+                    continue
+                stats['repaired'] += 1
+                self._remember_credit(business_id, credit['customer_id'], updated)
+                outstanding += outstanding_delta(float(credit.get('current_balance') or 0), rollup['current_balance'])
+        if outstanding:
+            self._summaries.adjust(business_id, outstanding=outstanding)
+
+        for customer_id in recounts:
+            stats['recounted'] += 1
+            try:
+                if self.reconcile(business_id, customer_id)['changed']:
+                    stats['repaired'] += 1
+            except Exception as e:
+                logger.warning(f"Reconciling customer {customer_id} of business {business_id} failed: {e}")
+                stats['failed'] += 1
+        return stats
+
+    def enqueue_reconcile(self, business_id, customer_id):
+        """Reconcile a customer in the background (at most one queued run per customer)"""
+        key = (business_id, customer_id)
+        with self._reconciling_lock:
+            if key in self._reconciling:
+                return False
+            self._reconciling.add(key)
+
+        def run():
+            try:
+                self.reconcile(business_id, customer_id)
+            except Exception as e:
+                logger.warning(f"Reconciling customer {customer_id} of business {business_id} failed: {e}")
+            finally:
+                with self._reconciling_lock:
+                    self._reconciling.discard(key)
+
+        _reconcile_executor.submit(run)
+        return True
+
+
+def _write_all(*calls, executor=None):
+    """
+    Run one ledger write's independent sub-writes concurrently (on the ledger
+    write pool unless executor is given) and wait for all of them: no deadline
+    and no cancellation, since some may already have landed. Returns their
+    results in order; a sub-write that raised yields None.
+    """
+    executor = executor or _write_executor
+    futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"Ledger sub-write failed: {e}")
+            results.append(None)
+    return results
+
+
+# Sub-writes of ledger writes, kept apart from the read fan-out pool
+_write_executor = ThreadPoolExecutor(max_workers=LEDGER_WRITE_WORKERS, thread_name_prefix='ledger-write')
+
+# Rollup repair batches of reconcile_business() callers that bring no pool of their own
+_repair_executor = ThreadPoolExecutor(max_workers=LEDGER_RECONCILE_BATCH_SIZE, thread_name_prefix='ledger-repair')
+
+# Background reconciliations queued by read paths that noticed drift
+_reconcile_executor = ThreadPoolExecutor(max_workers=LEDGER_RECONCILE_WORKERS, thread_name_prefix='ledger-reconcile')
+
+# One ledger per process, sharing the process's AppwriteDB
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    """The shared LedgerService instance"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = LedgerService(summaries=get_summaries())
+    return _ledger
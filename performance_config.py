@@ -1,4 +1,5 @@
 # Performance Optimization Configuration
+import os
 
 # Database query limits to prevent timeouts
 MAX_TRANSACTIONS_PER_PAGE = 25  # Reduced from 50
@@ -7,13 +8,89 @@ MAX_CUSTOMERS_PAGE = 100        # Customers page limit
 MAX_TRANSACTIONS_DASHBOARD = 10 # Dashboard transactions
 
 # Caching configuration
-CACHE_TTL_SECONDS = 60         # 1 minute cache
-ENABLE_REQUEST_CACHING = True  # Enable per-request caching
+# Optional cache tier shared by all gunicorn workers on the host: a SQLite WAL
+# file under each worker's in-memory cache plus memory-mapped generation
+# counters (<path>.generations) that carry invalidations between workers.
+# Set SHARED_CACHE_PATH to enable, e.g. SHARED_CACHE_PATH=/tmp/kathape-cache.sqlite3
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH')
+SHARED_CACHE_MAX_ENTRIES = 20000
+# Per-collection cache policy; anything a collection leaves out comes from 'default'.
+#   ttl           seconds a document or query result is fresh (writes refresh
+#                 the cache, so rarely-changing collections can be cached for hours,
+#                 but only when SHARED_CACHE_PATH carries invalidations to every
+#                 worker; without it another worker's edit shows up after ttl)
+#   stale_ttl     stale-while-revalidate window after ttl: the entry is still
+#                 served while a background refresh runs (0 = always wait)
+#   negative_ttl  seconds a not-found lookup / empty equality query is remembered
+#   max_entries   cap on this collection's share of the cache (None = no cap)
+#   cache_lists   whether list query results may be cached at all
+CACHE_POLICIES = {
+    'default': {'ttl': 60, 'stale_ttl': 0, 'negative_ttl': 30, 'max_entries': None, 'cache_lists': True},
+    'users': {'ttl': 60 * 60} if SHARED_CACHE_PATH else {},
+    'businesses': {'ttl': 6 * 60 * 60, 'stale_ttl': 60 * 60} if SHARED_CACHE_PATH else {},
+    'customers': {'ttl': 6 * 60 * 60, 'stale_ttl': 60 * 60} if SHARED_CACHE_PATH else {},
+    'customer_credits': {'ttl': 60, 'stale_ttl': 5 * 60, 'max_entries': 1024},
+    'transactions': {'ttl': 60, 'stale_ttl': 2 * 60, 'negative_ttl': 10, 'max_entries': 512},
+    'business_summaries': {'ttl': 60, 'stale_ttl': 5 * 60},
+}
+SWR_REFRESH_WORKERS = 2        # Background refresh threads per worker
+CACHE_MAX_ENTRIES = 2048       # Upper bound on cached documents per worker
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # ~32MB of cached payload per worker
+CACHE_LOCK_STRIPES = 16        # Independent cache locks for gthread workers
+# Warm restarts (opt-in, web process only): on a clean shutdown hot cache
+# entries are saved to CACHE_SNAPSHOT_PATH and the next start reloads them with
+# their remaining TTLs. A snapshot is consumed when loaded, so a crash never
+# brings back entries older than writes made since.
+# e.g. CACHE_SNAPSHOT_PATH=/tmp/kathape-cache-snapshot.json
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH')
+CACHE_SNAPSHOT_MAX_ENTRIES = 1000
+CACHE_SNAPSHOT_EXCLUDE = ('users',)  # Never written to disk (password hashes)
+NEGATIVE_CACHE_MAX_ENTRIES = 1024  # Not-found lookups remembered per collection
+ENABLE_REQUEST_CACHING = True  # Per-request identity map on flask.g (one fetch per document per request)
 
 # Connection optimization
 CONNECTION_TIMEOUT = 10        # 10 second timeout
 REQUEST_TIMEOUT = 15          # 15 second request timeout
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Retry and circuit breaker policy for Appwrite calls
+if os.environ.get('RENDER', False):
+    DB_RETRY_ATTEMPTS = 2
+    DB_RETRY_DELAY = 1.0
+else:
+    DB_RETRY_ATTEMPTS = 3
+    DB_RETRY_DELAY = 1  # seconds
+RETRY_MAX_DELAY = 4            # Cap on a single backoff sleep (seconds)
+# Total seconds one call may spend across its attempts. A retry only starts if
+# it could still run for a full REQUEST_TIMEOUT inside the budget, so a read
+# timeout is never retried and a call stays under gunicorn's 30s worker timeout.
+RETRY_BUDGET = 20
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive transient failures before a collection's circuit opens
+CIRCUIT_RESET_TIMEOUT = 30     # Seconds to fail fast before probing Appwrite again
+
+# Concurrent fan-out of independent queries within one request
+FANOUT_MAX_WORKERS = 8         # Threads shared by all requests in a worker
+FANOUT_TIMEOUT = REQUEST_TIMEOUT  # Deadline for a whole fan-out batch
+# Ledger writes fan out on their own pool, wide enough for every request thread
+# to have all sub-writes of one transaction in flight at once, so concurrent
+# POSTs never queue behind each other; they are always waited for, never
+# cancelled by a deadline. A payment to an existing customer is the widest:
+# create, balance, 4 rollups and 3 summary counters.
+LEDGER_SUBWRITES = 9
+LEDGER_WRITE_WORKERS = GUNICORN_THREADS * LEDGER_SUBWRITES
+
+# Keep-alive connections to Appwrite per worker: request, fan-out, refresh and ledger write threads
+HTTP_POOL_SIZE = GUNICORN_THREADS + FANOUT_MAX_WORKERS + SWR_REFRESH_WORKERS + LEDGER_WRITE_WORKERS
+ASYNC_HTTP_MAX_CONNECTIONS = 32  # Concurrent Appwrite requests from AsyncAppwriteDB per worker
+
+# Ledger writes (transaction + balance change)
+LEDGER_LOCK_STRIPES = 64         # Locks serializing writes per (business, customer) within a worker
+LEDGER_CREDIT_CACHE_SIZE = 4096  # Credit document IDs remembered per worker
+LEDGER_RECONCILE_WORKERS = 1     # Background balance reconciliations per worker
+LEDGER_RECONCILE_BATCH_SIZE = 25 # Drifted credits written concurrently by a bulk reconcile
+RECONCILE_JOB_WORKERS = 4        # Businesses reconciled in parallel by reconcile_ledgers.py
 
 # Pagination settings
 DEFAULT_PAGE_SIZE = 25        # Smaller page sizes for better performance
 MAX_PAGE_SIZE = 50           # Maximum allowed page size
+STREAM_PAGE_SIZE = 100       # Documents per round trip when streaming whole collections
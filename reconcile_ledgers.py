@@ -0,0 +1,240 @@
+"""
+Bulk ledger reconciliation: audit every business (or the given ones) after an
+outage or a bad deploy and repair drifted customer_credits.
+
+Businesses are streamed and handed to a pool of workers; each worker scans the
+business's credits and transactions once, recomputes every customer's rollups
+and writes back only the credits that drifted, in concurrent batches on the
+job's own write pool (see LedgerService.reconcile_business). Progress and the final report show
+throughput and drift statistics.
+
+Finished businesses are recorded in a checkpoint file, so an interrupted run
+picks up where it stopped; a run that completes without failures removes it.
+
+    python reconcile_ledgers.py                      # every business
+    python reconcile_ledgers.py --dry-run            # report drift, write nothing
+    python reconcile_ledgers.py --workers 8 <business_id>…
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from appwrite_utils import get_db
+from ledger_service import get_ledger
+from performance_config import LEDGER_RECONCILE_BATCH_SIZE, RECONCILE_JOB_WORKERS
+
+DEFAULT_CHECKPOINT = 'reconcile_checkpoint.json'
+CHECKPOINT_INTERVAL = 5  # seconds between checkpoint saves
+PROGRESS_INTERVAL = 10   # seconds between progress lines
+
+_print_lock = threading.Lock()
+
+
+def say(message):
+    """print() from worker threads without interleaving lines"""
+    with _print_lock:
+        print(message, flush=True)
+
+
+class Checkpoint:
+    """IDs of businesses already reconciled, saved atomically to a JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.done = set(json.load(f).get('done', []))
+        return self.done
+
+    def mark_done(self, business_id):
+        with self._lock:
+            self.done.add(business_id)
+            if time.time() - self._saved_at >= CHECKPOINT_INTERVAL:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(self.done), 'saved_at': time.time()}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.time()
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Report:
+    """Running totals across workers"""
+
+    COUNTERS = ('credits', 'transactions', 'drifted', 'missing', 'repaired', 'recounted', 'failed')
+
+    def __init__(self):
+        self.started = time.time()
+        self.businesses = 0
+        self.failed_businesses = 0
+        self.skipped = 0
+        self.interrupted = False
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.balance_drift = 0.0
+        self.fields = {}
+        self._lock = threading.Lock()
+
+    def add(self, stats):
+        with self._lock:
+            self.businesses += 1
+            for key in self.COUNTERS:
+                self.totals[key] += stats[key]
+            self.balance_drift += stats['balance_drift']
+            for field, count in stats['fields'].items():
+                self.fields[field] = self.fields.get(field, 0) + count
+
+    def add_failure(self):
+        with self._lock:
+            self.failed_businesses += 1
+
+    def rates(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return elapsed, self.businesses / elapsed, self.totals['transactions'] / elapsed
+
+    def progress(self):
+        elapsed, businesses_rate, transactions_rate = self.rates()
+        return (f"⏱️  {self.businesses} businesses in {elapsed:.0f}s ({businesses_rate:.1f}/s, "
+                f"{transactions_rate:,.0f} transactions/s), {self.totals['drifted']} drifted credits")
+
+    def summary(self, dry_run):
+        elapsed, businesses_rate, transactions_rate = self.rates()
+        credits = self.totals['credits']
+        lines = [
+            f"Reconciled {self.businesses} businesses in {elapsed:.1f}s "
+            f"({self.skipped} skipped from checkpoint, {self.failed_businesses} failed)",
+            f"  Throughput: {businesses_rate:.1f} businesses/s, {credits / elapsed:,.0f} credits/s, "
+            f"{transactions_rate:,.0f} transactions/s ({self.totals['transactions']:,} transactions)",
+            f"  Drift: {self.totals['drifted']} of {credits} credits "
+            f"({self.totals['drifted'] / credits * 100 if credits else 0:.2f}%), "
+            f"{self.totals['missing']} missing credit documents, "
+            f"₹{self.balance_drift:,.2f} absolute balance error",
+        ]
+        if self.fields:
+            lines.append("  Drifted fields: " + ", ".join(
+                f"{field} {count}" for field, count in sorted(self.fields.items(), key=lambda item: -item[1])))
+        if dry_run:
+            lines.append("  Dry run: nothing written")
+        else:
+            lines.append(f"  Written: {self.totals['repaired']} credits repaired, "
+                         f"{self.totals['recounted']} recounted under lock, "
+                         f"{self.totals['failed']} customer failures")
+        return "\n".join(lines)
+
+
+def run(business_ids=None, workers=RECONCILE_JOB_WORKERS, batch_size=LEDGER_RECONCILE_BATCH_SIZE,
+        checkpoint_path=DEFAULT_CHECKPOINT, restart=False, dry_run=False):
+    """Reconcile the given businesses (all of them by default); returns the Report"""
+    ledger = get_ledger()
+    report = Report()
+    # A dry run neither skips nor records businesses
+    checkpoint = Checkpoint(None if dry_run else checkpoint_path)
+    if restart:
+        checkpoint.remove()
+    elif checkpoint.load():
+        say(f"↩️  Resuming: {len(checkpoint.done)} businesses already reconciled ({checkpoint_path})")
+    if not business_ids:
+        business_ids = (business['$id'] for business in get_db().iter_documents('businesses', fields=['name']))
+
+    def reconcile(business_id):
+        stats = ledger.reconcile_business(business_id, batch_size=batch_size, dry_run=dry_run,
+                                          executor=write_executor)
+        report.add(stats)
+        if stats['drifted'] or stats['missing'] or stats['failed']:
+            say(f"⚠️  Business {business_id}: {stats['drifted']}/{stats['credits']} credits drifted, "
+                  f"{stats['missing']} missing, {stats['repaired']} repaired, {stats['failed']} failed")
+        if not stats['failed'] and not dry_run:
+            checkpoint.mark_done(business_id)
+
+    def collect(finished):
+        for future in finished:
+            try:
+                future.result()
+            except Exception as e:
+                report.add_failure()
+                say(f"❌ Business {futures.pop(future)}: {e}")
+            else:
+                futures.pop(future)
+
+    futures = {}
+    last_progress = time.time()
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='reconcile-job')
+    # Every worker can have a full batch of writes in flight; none share the app's pools or deadlines
+    write_executor = ThreadPoolExecutor(max_workers=max(1, workers) * max(1, batch_size),
+                                        thread_name_prefix='reconcile-write')
+    try:
+        for business_id in business_ids:
+            if business_id in checkpoint.done:
+                report.skipped += 1
+                continue
+            futures[executor.submit(reconcile, business_id)] = business_id
+            # Keep only a couple of businesses queued per worker while streaming the rest
+            if len(futures) >= 2 * max(1, workers):
+                finished, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                collect(finished)
+            if time.time() - last_progress >= PROGRESS_INTERVAL:
+                say(report.progress())
+                last_progress = time.time()
+        collect(wait(list(futures))[0])
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted: finishing running businesses and saving the checkpoint...")
+        for future in futures:
+            future.cancel()
+        collect(wait([future for future in futures if not future.cancelled()])[0])
+        report.interrupted = True
+    finally:
+        executor.shutdown(wait=True)
+        write_executor.shutdown(wait=True)
+        checkpoint.save()
+    if not dry_run and not report.interrupted and not report.failed_businesses and not report.totals['failed']:
+        checkpoint.remove()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute customer balances and rollups from transactions "
+                                                 "and repair drifted customer_credits.")
+    parser.add_argument('business_ids', nargs='*', help="Businesses to reconcile (default: all)")
+    parser.add_argument('--workers', type=int, default=RECONCILE_JOB_WORKERS,
+                        help=f"Businesses reconciled in parallel (default {RECONCILE_JOB_WORKERS})")
+    parser.add_argument('--batch-size', type=int, default=LEDGER_RECONCILE_BATCH_SIZE,
+                        help=f"Drifted credits written concurrently (default {LEDGER_RECONCILE_BATCH_SIZE})")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT,
+                        help=f"Checkpoint file for resuming (default {DEFAULT_CHECKPOINT})")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint")
+    parser.add_argument('--dry-run', action='store_true', help="Report drift without writing anything")
+    args = parser.parse_args(argv)
+
+    print("🚀 Reconciling customer ledgers...")
+    report = run(args.business_ids, workers=args.workers, batch_size=args.batch_size,
+                 checkpoint_path=args.checkpoint, restart=args.restart, dry_run=args.dry_run)
+    print(f"\n🎉 {report.summary(args.dry_run)}")
+    if report.interrupted:
+        if not args.dry_run:
+            print(f"Checkpoint saved to {args.checkpoint}; run again to resume.")
+        return 130
+    return 1 if report.failed_businesses or report.totals['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,78 @@ from appwrite.role import Role
 from appwrite.exception import AppwriteException
 from appwrite_config import AppwriteConfig
 
+def create_attribute(databases, database_id, collection_id, attr):
+    """Create one attribute from its collection config entry"""
+    if attr['type'] == 'string':
+        databases.create_string_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            size=attr['size'],
+            required=attr['required'],
+            default=attr.get('default', None),
+            array=False
+        )
+    elif attr['type'] == 'boolean':
+        databases.create_boolean_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            required=attr['required'],
+            default=attr.get('default', None),
+            array=False
+        )
+    elif attr['type'] == 'double':
+        databases.create_float_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            required=attr['required'],
+            min=None,
+            max=None,
+            default=attr.get('default', None),
+            array=False
+        )
+    elif attr['type'] == 'integer':
+        databases.create_integer_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            required=attr['required'],
+            min=None,
+            max=None,
+            default=attr.get('default', None),
+            array=False
+        )
+    elif attr['type'] == 'datetime':
+        databases.create_datetime_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            required=attr['required'],
+            default=attr.get('default', None),
+            array=False
+        )
+    elif attr['type'] == 'enum':
+        databases.create_enum_attribute(
+            database_id=database_id,
+            collection_id=collection_id,
+            key=attr['key'],
+            elements=attr['elements'],
+            required=attr['required'],
+            default=attr.get('default', None),
+            array=False
+        )
+
+def add_missing_attributes(databases, database_id, collection_config):
+    """Create attributes added to an existing collection's config since it was set up"""
+    existing = databases.list_attributes(database_id, collection_config['id'])
+    existing_keys = {attribute['key'] for attribute in existing.get('attributes', [])}
+    for attr in collection_config['attributes']:
+        if attr['key'] not in existing_keys:
+            print(f"  Adding attribute '{attr['key']}'...")
+            create_attribute(databases, database_id, collection_config['id'], attr)
+
 def setup_collections():
     """Create all necessary collections in Appwrite"""
     
@@ -112,6 +184,11 @@ def setup_collections():
                     {'key': 'business_id', 'type': 'string', 'size': 36, 'required': True},
                     {'key': 'customer_id', 'type': 'string', 'size': 36, 'required': True},
                     {'key': 'current_balance', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'transaction_count', 'type': 'integer', 'required': False, 'default': 0},
+                    {'key': 'credit_total', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'payment_total', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'last_transaction_at', 'type': 'datetime', 'required': False},
+                    {'key': 'last_payment_at', 'type': 'datetime', 'required': False},
                     {'key': 'credit_limit', 'type': 'double', 'required': False, 'default': 0.0},
                     {'key': 'is_active', 'type': 'boolean', 'required': False, 'default': True},
                     {'key': 'created_at', 'type': 'datetime', 'required': False},
@@ -150,6 +227,24 @@ def setup_collections():
                     {'key': 'created_at_index', 'type': 'key', 'attributes': ['created_at']},
                     {'key': 'amount_index', 'type': 'key', 'attributes': ['amount']}
                 ]
+            },
+            {
+                # One document per business, its ID being the business ID; kept by ledger_service
+                'id': config.collections['business_summaries'],
+                'name': 'Business Summaries',
+                'attributes': [
+                    {'key': 'business_id', 'type': 'string', 'size': 36, 'required': True},
+                    {'key': 'customer_count', 'type': 'integer', 'required': False, 'default': 0},
+                    {'key': 'total_outstanding', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'credit_total', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'payment_total', 'type': 'double', 'required': False, 'default': 0.0},
+                    {'key': 'last_activity_at', 'type': 'datetime', 'required': False},
+                    {'key': 'created_at', 'type': 'datetime', 'required': False},
+                    {'key': 'updated_at', 'type': 'datetime', 'required': False}
+                ],
+                'indexes': [
+                    {'key': 'business_id_index', 'type': 'unique', 'attributes': ['business_id']}
+                ]
             }
         ]
         
@@ -160,6 +255,7 @@ def setup_collections():
                 try:
                     existing = databases.get_collection(config.database_id, collection_config['id'])
                     print(f"Collection '{collection_config['name']}' already exists")
+                    add_missing_attributes(databases, config.database_id, collection_config)
                     continue
                 except AppwriteException as e:
                     if e.code != 404:
@@ -182,56 +278,7 @@ def setup_collections():
                 # Create attributes
                 for attr in collection_config['attributes']:
                     print(f"  Creating attribute '{attr['key']}'...")
-                    
-                    if attr['type'] == 'string':
-                        databases.create_string_attribute(
-                            database_id=config.database_id,
-                            collection_id=collection_config['id'],
-                            key=attr['key'],
-                            size=attr['size'],
-                            required=attr['required'],
-                            default=attr.get('default', None),
-                            array=False
-                        )
-                    elif attr['type'] == 'boolean':
-                        databases.create_boolean_attribute(
-                            database_id=config.database_id,
-                            collection_id=collection_config['id'],
-                            key=attr['key'],
-                            required=attr['required'],
-                            default=attr.get('default', None),
-                            array=False
-                        )
-                    elif attr['type'] == 'double':
-                        databases.create_float_attribute(
-                            database_id=config.database_id,
-                            collection_id=collection_config['id'],
-                            key=attr['key'],
-                            required=attr['required'],
-                            min=None,
-                            max=None,
-                            default=attr.get('default', None),
-                            array=False
-                        )
-                    elif attr['type'] == 'datetime':
-                        databases.create_datetime_attribute(
-                            database_id=config.database_id,
-                            collection_id=collection_config['id'],
-                            key=attr['key'],
-                            required=attr['required'],
-                            default=attr.get('default', None),
-                            array=False
-                        )
-                    elif attr['type'] == 'enum':
-                        databases.create_enum_attribute(
-                            database_id=config.database_id,
-                            collection_id=collection_config['id'],
-                            key=attr['key'],
-                            elements=attr['elements'],
-                            required=attr['required'],
-                            default=attr.get('default', None),
-                            array=False
-                        )
+                    create_attribute(databases, config.database_id, collection_config['id'], attr)
                 
                 # Wait a moment for attributes to be created
                 import time